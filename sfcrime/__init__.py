@@ -0,0 +1 @@
+"""Data helpers for the SF crime dashboard that run without a Streamlit session."""
@@ -0,0 +1,156 @@
+"""Precomputed count cube and the chart queries answered from it."""
+import calendar
+
+import numpy as np
+import pandas as pd
+
+from sfcrime.data import concat_frames
+from sfcrime.datetime_features import DAY_ORDER, MONTH_ORDER
+from sfcrime.parallel import WORKERS, count_combinations
+
+# Dimensions the cube is built over; every chart groups by a subset of these
+CUBE_DIMENSIONS = ['Category', 'PdDistrict', 'Hour', 'DayOfWeek', 'Month', 'Year']
+
+
+def dimension_codes(col):
+    """Integer codes and their labels for one cube dimension (-1 marks missing values)."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return col.cat.codes.to_numpy(), col.cat.categories
+    codes, uniques = pd.factorize(col, sort=True)
+    return codes, pd.Index(uniques)
+
+
+def build_cube(df, dims=None, mask=None, workers=WORKERS):
+    """Count incidents for every observed combination of ``dims`` (default: all cube dimensions).
+
+    ``mask`` optionally restricts the count to a boolean row selection without
+    copying the frame. Row partitions are counted on ``workers`` threads.
+    Rows missing a value are kept, in cells where that dimension is missing.
+    """
+    dims = [dim for dim in (dims or CUBE_DIMENSIONS) if dim in df.columns]
+    codes, levels = zip(*(dimension_codes(df[dim]) for dim in dims))
+    codes, shape = _missing_as_level(codes, levels)
+    cells, counts = count_combinations(codes, shape, mask=mask, workers=workers)
+    return _cells_frame(df, dims, levels, shape, cells, counts)
+
+
+def _missing_as_level(codes, levels):
+    """Codes with missing values (-1) moved to an extra last level, and the widened shape.
+
+    A row missing one dimension still belongs in the totals of the others,
+    so the cube keeps it in a cell whose value for that dimension is missing.
+    """
+    codes = [np.where(c < 0, len(level), c) if (c < 0).any() else c for c, level in zip(codes, levels)]
+    return codes, tuple(len(level) + 1 for level in levels)
+
+
+def _cells_frame(source, dims, levels, shape, cells, counts):
+    """Frame with one row per flat cell index, decoded back to the dimension values of ``source``.
+
+    Codes past the last level of a dimension decode to a missing value.
+    """
+    frame = {}
+    for dim, level, cell_codes in zip(dims, levels, np.unravel_index(cells, shape)):
+        cell_codes = np.where(cell_codes < len(level), cell_codes, -1)
+        if isinstance(source[dim].dtype, pd.CategoricalDtype):
+            frame[dim] = pd.Categorical.from_codes(cell_codes, dtype=source[dim].dtype)
+        elif (cell_codes < 0).any():
+            frame[dim] = level.take(cell_codes, allow_fill=True, fill_value=np.nan).to_numpy()
+        else:
+            frame[dim] = level.to_numpy()[cell_codes]
+    frame['Count'] = counts
+    return pd.DataFrame(frame)
+
+
+def merge_cubes(cubes):
+    """Combine cubes built from disjoint row sets into one."""
+    cubes = list(cubes)
+    dims = [col for col in cubes[0].columns if col != 'Count']
+    return cube_counts(concat_frames(cubes), dims, dropna=False)
+
+
+def cube_counts(cube, dims, dropna=True):
+    """Sum the cube over every dimension not in ``dims``.
+
+    Equivalent to ``cube.groupby(dims, observed=True, dropna=dropna)['Count'].sum()``,
+    but counted with partitioned, weighted ``bincount`` over the dimension codes.
+    Like ``value_counts``, cells missing a value of ``dims`` are left out unless
+    ``dropna`` is false; missing values of the dimensions summed over still count.
+    """
+    codes, levels = zip(*(dimension_codes(cube[dim]) for dim in dims))
+    if dropna:
+        shape = tuple(len(level) for level in levels)
+    else:
+        codes, shape = _missing_as_level(codes, levels)
+    cells, counts = count_combinations(codes, shape, weights=cube['Count'].to_numpy())
+    return _cells_frame(cube, dims, levels, shape, cells, counts)
+
+
+def category_counts(cube, top_n=None):
+    counts = cube_counts(cube, ['Category']).sort_values('Count', ascending=False, ignore_index=True)
+    return counts.head(top_n) if top_n else counts
+
+
+def top_categories(cube, top_n):
+    return category_counts(cube, top_n)['Category'].tolist()
+
+
+def district_counts(cube):
+    counts = cube_counts(cube, ['PdDistrict']).sort_values('Count', ascending=False, ignore_index=True)
+    return counts.rename(columns={'PdDistrict': 'District'})
+
+
+def hour_counts(cube):
+    return cube_counts(cube, ['Hour'])
+
+
+def day_of_week_counts(cube):
+    counts = cube_counts(cube, ['DayOfWeek'])
+    counts['DayOfWeek'] = pd.Categorical(counts['DayOfWeek'].astype(str), categories=DAY_ORDER, ordered=True)
+    return counts.sort_values('DayOfWeek', ignore_index=True)
+
+
+def month_counts(cube):
+    counts = cube_counts(cube, ['Month'])
+    # The cube stores month numbers; uploads may still carry month names
+    months = counts['Month']
+    if pd.api.types.is_numeric_dtype(months):
+        months = months.map(lambda m: calendar.month_name[int(m)])
+    counts['Month'] = pd.Categorical(months.astype(str), categories=MONTH_ORDER, ordered=True)
+    return counts.sort_values('Month', ignore_index=True)
+
+
+def category_district_crosstab(cube, top_n):
+    """Category x district counts for the ``top_n`` categories, shaped like ``pd.crosstab``."""
+    categories = top_categories(cube, top_n)
+    counts = cube_counts(cube[cube['Category'].isin(categories)], ['Category', 'PdDistrict'])
+    pivot = counts.pivot_table(index='Category', columns='PdDistrict', values='Count',
+                               aggfunc='sum', fill_value=0, observed=True)
+    pivot.index = pivot.index.astype(str)
+    pivot.columns = pivot.columns.astype(str)
+    pivot.index.name, pivot.columns.name = 'Category', 'PdDistrict'
+    return pivot
+
+
+def category_hour_counts(cube, top_n):
+    categories = top_categories(cube, top_n)
+    return cube_counts(cube[cube['Category'].isin(categories)], ['Category', 'Hour'])
+
+
+def custom_counts(cube, x_axis, color_by=None, percentage=False):
+    """Counts behind the Custom Analysis builder.
+
+    Without ``color_by`` the result is ordered by count like ``value_counts``;
+    with it, percentages are normalized within each ``x_axis`` group.
+    """
+    if color_by is None:
+        counts = cube_counts(cube, [x_axis]).sort_values('Count', ascending=False, ignore_index=True)
+        if percentage:
+            counts['Percentage'] = counts['Count'] / counts['Count'].sum() * 100
+        return counts
+
+    counts = cube_counts(cube, [x_axis, color_by])
+    if percentage:
+        total_by_x = counts.groupby(x_axis, observed=True)['Count'].transform('sum')
+        counts['Percentage'] = counts['Count'] / total_by_x * 100
+    return counts
@@ -0,0 +1,81 @@
+"""Cached dataset loaders and figures shared by the app and its warm-up.
+
+Streamlit keys a cached function by its module, name and source, so keeping
+these here rather than in the app script lets ``sfcrime.warmup`` fill the
+same cache entries the first session reads.
+"""
+import streamlit as st
+
+from sfcrime import charts
+from sfcrime.aggregates import build_cube
+from sfcrime.backend import FrameBackend, ParquetBackend
+from sfcrime.data import DEMO_CSV, REQUIRED_COLUMNS, load_dataset
+from sfcrime.filters import BitmapIndex
+from sfcrime.render import compact_figure
+from sfcrime.store import IncidentStore
+
+
+def chart_key(dataset_key, filters):
+    """Cache key of the charts drawn for ``dataset_key`` under a filter selection."""
+    return f"{dataset_key}|{filters!r}"
+
+
+# Demo data as a read-only memory map of the columnar cache, handed to every
+# session as is rather than copied per rerun
+@st.cache_resource
+def load_demo_data():
+    try:
+        # Parsed once into a columnar cache next to the app, memory-mapped on later starts
+        df = load_dataset(DEMO_CSV)
+
+        # Ensure required columns exist
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+        if missing_columns:
+            st.error(f"Missing required columns in dataset: {', '.join(missing_columns)}")
+            return None
+
+        return df
+    except Exception as e:
+        st.error(f"Error loading demo data: {str(e)}")
+        return None
+
+
+# Stored rows and their cube, reloaded whenever a batch is appended and
+# shared read-only by all sessions
+@st.cache_resource(max_entries=2)
+def load_store_data(root, store_key):
+    stored = IncidentStore(root)
+    return stored.frame(), stored.cube()
+
+
+# Aggregate cube, built once per dataset and shared by every chart
+@st.cache_data(max_entries=16)
+def load_cube(_df, dataset_key):
+    return build_cube(_df)
+
+
+# Compacted figures memoized by dataset and widget parameters, so repeating an
+# earlier combination of settings skips the aggregation, the figure build and
+# the compaction. Shared rather than copied per rerun: rendering only reads them
+@st.cache_resource(max_entries=256)
+def cached_chart(_source, dataset_key, builder, params):
+    return compact_figure(getattr(charts, builder)(_source, *params))
+
+
+# Loaded rows with their bitmap index, shared by all sessions; the spatial
+# index is built on the first location search and kept with them
+@st.cache_resource(max_entries=8)
+def load_frame_backend(_df, _cube, dataset_key):
+    return FrameBackend(_df, _cube, BitmapIndex(_df))
+
+
+# Cube restricted to the sidebar filters
+@st.cache_data(max_entries=32)
+def load_filtered_cube(_backend, dataset_key, filters):
+    return _backend.cube(filters)
+
+
+# DuckDB over a year-partitioned Parquet directory, reopened when its files change
+@st.cache_resource(max_entries=2)
+def load_parquet_backend(root, signature):
+    return ParquetBackend(root)
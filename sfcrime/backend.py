@@ -0,0 +1,337 @@
+"""Query backends behind the dashboard views: in-memory frames and out-of-core Parquet.
+
+Every view is drawn from the aggregate cube, the map bins, the daily series,
+the sparse description crosstab or a radius search, so a backend only has to
+answer those for a filter selection. ``FrameBackend`` computes
+them from a loaded frame; ``ParquetBackend`` pushes the group-bys down to
+DuckDB over a year-partitioned Parquet directory, so memory use follows the
+size of the results rather than the length of the history.
+
+Convert a CSV to the partitioned layout with
+``python -m sfcrime.backend train.csv data/incidents``.
+"""
+import argparse
+import datetime
+import functools
+import glob
+import hashlib
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from sfcrime.aggregates import CUBE_DIMENSIONS
+from sfcrime.crosstab import CROSSTAB_DIMENSIONS, SparseCrosstab
+from sfcrime.data import CACHE_DIR, CATEGORY_COLUMNS, apply_schema
+from sfcrime.datetime_features import DAY_DTYPE
+from sfcrime.filters import Filters, filter_cube, filtered_cube
+from sfcrime.ingest import CHUNK_ROWS, ChunkedIngest
+from sfcrime.spatial import (MAX_CELLS, METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON, NEARBY_COLUMNS,
+                             SF_LAT_RANGE, SF_LON_RANGE, Nearby, SpatialIndex, bin_by_zoom, nearby_result,
+                             zoom_cell_size)
+from sfcrime.timeseries import DailySeries
+
+try:
+    import duckdb
+except ImportError:  # only needed for ParquetBackend
+    duckdb = None
+
+# Directory of year-partitioned Parquet files to query instead of the demo CSV
+PARQUET_DIR = os.environ.get("SFCRIME_PARQUET_DIR")
+PARTITION_COLUMN = 'Year'
+
+# DuckDB spills to disk past this, keeping the app's footprint bounded
+DUCKDB_MEMORY_LIMIT = os.environ.get("SFCRIME_DUCKDB_MEMORY", "1GB")
+
+
+def parquet_signature(root):
+    """Digest of the names, sizes and modification times of the Parquet files under ``root``."""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(root, '**', '*.parquet'), recursive=True)):
+        stat = os.stat(path)
+        digest.update(f"{os.path.relpath(path, root)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+class FrameBackend:
+    """Queries answered from a loaded frame, its cube and its bitmap index."""
+
+    def __init__(self, df, cube, index):
+        self.df = df
+        self.index = index
+        self._cube = cube
+        self.columns = list(df.columns)
+        self.rows = len(df)
+
+    def date_bounds(self):
+        return self.index.date_bounds()
+
+    def values(self, col):
+        return self.index.values(col)
+
+    def cube(self, filters=Filters()):
+        return filtered_cube(self.df, self._cube, self.index, filters)
+
+    def map_bins(self, zoom, filters=Filters(), max_cells=MAX_CELLS):
+        return bin_by_zoom(self.df, zoom, max_cells, mask=self.index.mask(filters))
+
+    def daily_series(self, group_by=None, filters=Filters()):
+        return DailySeries.from_frame(self.df, group_by, mask=self.index.mask(filters))
+
+    def crosstab(self, filters=Filters()):
+        return SparseCrosstab.from_frame(self.df, mask=self.index.mask(filters))
+
+    @functools.cached_property
+    def spatial_index(self):
+        """Grid index over the coordinates, built on the first location query."""
+        return SpatialIndex.from_frame(self.df)
+
+    def search_addresses(self, text, limit=20):
+        return self.spatial_index.search_addresses(text, limit)
+
+    def locate(self, address):
+        return self.spatial_index.locate(address)
+
+    def nearby(self, lon, lat, radius, filters=Filters(), limit=1000):
+        """Incidents within ``radius`` metres of a point, as a ``spatial.Nearby``."""
+        rows, distances = self.spatial_index.within(lon, lat, radius)
+        mask = self.index.mask(filters)
+        if mask is not None:
+            keep = mask[rows]
+            rows, distances = rows[keep], distances[keep]
+        return nearby_result(self.df, rows, distances, limit)
+
+
+class CubeBackend:
+    """The cube of an upload that is still being read, without its rows.
+
+    Only the cube-based views can be drawn, and only the filters that slice
+    the cube are offered: there are no date bounds and no resolution values.
+    """
+
+    def __init__(self, cube, rows):
+        self._cube = cube
+        self.columns = list(cube.columns)
+        self.rows = rows
+
+    def date_bounds(self):
+        return None
+
+    def values(self, col):
+        if col not in self.columns or col == 'Count':
+            return []
+        return sorted(self._cube[col].dropna().unique().tolist())
+
+    def cube(self, filters=Filters()):
+        return filter_cube(self._cube, filters) if filters.active else self._cube
+
+
+class ParquetBackend:
+    """Queries pushed down to DuckDB over Parquet files partitioned by ``Year``.
+
+    Only aggregates come back into pandas: the cube is one ``GROUP BY`` over
+    the cube dimensions and the map bins another over grid cells. Filters
+    become ``WHERE`` clauses, and date bounds also restrict ``Year`` so whole
+    partitions are skipped.
+    """
+
+    def __init__(self, root, memory_limit=DUCKDB_MEMORY_LIMIT):
+        if duckdb is None:
+            raise ImportError("The Parquet backend needs the duckdb package (pip install duckdb)")
+        self.root = root
+        self._con = duckdb.connect(config={
+            'memory_limit': memory_limit,
+            'temp_directory': os.path.join(CACHE_DIR, 'duckdb'),
+        })
+        pattern = os.path.join(root, '**', '*.parquet').replace("'", "''")
+        self._con.execute(f"CREATE VIEW incidents AS SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)")
+        self.columns = [row[0] for row in self._query("DESCRIBE incidents").fetchall()]
+        self.rows = self._query("SELECT count(*) FROM incidents").fetchone()[0]
+        self._values = {}
+
+    def date_bounds(self):
+        if 'Dates' not in self.columns:
+            return None
+        first, last = self._query("SELECT min(Dates), max(Dates) FROM incidents").fetchone()
+        if first is None:
+            return None
+        return first.date(), last.date()
+
+    def values(self, col):
+        if col not in self.columns:
+            return []
+        if col not in self._values:
+            rows = self._query(f"SELECT DISTINCT {col} FROM incidents WHERE {col} IS NOT NULL ORDER BY 1").fetchall()
+            self._values[col] = [row[0] for row in rows]
+        return self._values[col]
+
+    def cube(self, filters=Filters()):
+        dims = [dim for dim in CUBE_DIMENSIONS if dim in self.columns]
+        # Like build_cube, rows missing a category or district keep a cell of their own
+        where, params = self._where(filters, [f"{dim} IS NOT NULL" for dim in dims
+                                              if dim not in CATEGORY_COLUMNS])
+        table = self._fetch_arrow(f"SELECT {', '.join(dims)}, count(*) AS Count FROM incidents {where} GROUP BY ALL",
+                                  params)
+        return self._with_schema(table)
+
+    def map_bins(self, zoom, filters=Filters(), max_cells=MAX_CELLS):
+        """Grid bins matching ``spatial.bin_points``, aggregated inside DuckDB."""
+        cell_size = zoom_cell_size(zoom)
+        where, params = self._where(filters, ["Category IS NOT NULL", *self._in_city()])
+        # Per-category counts and coordinate sums per cell, then the dominant category of each cell
+        binned = self._query(f"""
+            WITH by_category AS (
+                SELECT floor((Y - {SF_LAT_RANGE[0]}) / {cell_size}) AS cell_row,
+                       floor((X - {SF_LON_RANGE[0]}) / {cell_size}) AS cell_col,
+                       Category, count(*) AS n, sum(X::DOUBLE) AS sum_x, sum(Y::DOUBLE) AS sum_y
+                FROM incidents {where}
+                GROUP BY ALL
+            )
+            SELECT sum(sum_x) / sum(n) AS X, sum(sum_y) / sum(n) AS Y, sum(n)::BIGINT AS Count,
+                   arg_max(Category, n) AS Category, max(n) / sum(n) AS CategoryShare
+            FROM by_category
+            GROUP BY cell_row, cell_col
+            ORDER BY Count DESC
+            LIMIT {int(max_cells)}
+        """, params).df()
+        binned['Category'] = pd.Categorical(binned['Category'], categories=self.values('Category'))
+        return binned
+
+    def daily_series(self, group_by=None, filters=Filters()):
+        """Daily counts per ``group_by`` value, grouped by DuckDB."""
+        group = group_by or "'All'"
+        where, params = self._where(filters, ["Dates IS NOT NULL", f"{group} IS NOT NULL"])
+        table = self._fetch_arrow(f"SELECT CAST(Dates AS DATE) AS day, {group} AS label, count(*) AS n "
+                                  f"FROM incidents {where} GROUP BY ALL", params)
+        labels = self.values(group_by) if group_by else ['All']
+        codes = pd.Categorical(table.column('label').to_numpy(zero_copy_only=False), categories=labels).codes
+        days = table.column('day').to_numpy(zero_copy_only=False).astype('datetime64[D]')
+        return DailySeries.from_codes(days, codes, labels, weights=table.column('n').to_numpy())
+
+    def crosstab(self, filters=Filters()):
+        """``SparseCrosstab`` built from the cells counted by DuckDB."""
+        where, params = self._where(filters, [f"{dim} IS NOT NULL" for dim in CROSSTAB_DIMENSIONS])
+        table = self._fetch_arrow(f"SELECT {', '.join(CROSSTAB_DIMENSIONS)}, count(*) AS Count "
+                                  f"FROM incidents {where} GROUP BY ALL", params)
+        counts = self._with_schema(table)
+        return SparseCrosstab.from_frame(counts, weights=counts['Count'].to_numpy())
+
+    def search_addresses(self, text, limit=20):
+        if 'Address' not in self.columns or not text:
+            return []
+        rows = self._query("SELECT DISTINCT Address FROM incidents WHERE contains(lower(Address), lower(?)) "
+                           "ORDER BY 1 LIMIT ?", [text, int(limit)]).fetchall()
+        return [row[0] for row in rows]
+
+    def locate(self, address):
+        where, params = self._where(Filters(), ["Address = ?", *self._in_city()])
+        lon, lat = self._query(f"SELECT avg(X), avg(Y) FROM incidents {where}", [address, *params]).fetchone()
+        return None if lon is None else (lon, lat)
+
+    def nearby(self, lon, lat, radius, filters=Filters(), limit=1000):
+        """Radius search as a bounding-box scan with exact distances, computed in DuckDB."""
+        half_width, half_height = radius / METERS_PER_DEGREE_LON, radius / METERS_PER_DEGREE_LAT
+        where, params = self._where(filters, [
+            *self._in_city(),
+            f"X BETWEEN {lon - half_width} AND {lon + half_width}",
+            f"Y BETWEEN {lat - half_height} AND {lat + half_height}",
+        ])
+        columns = ', '.join(col for col in NEARBY_COLUMNS if col in self.columns)
+        matches = f"""
+            SELECT *, sqrt(pow((X - ({lon})) * {METERS_PER_DEGREE_LON}, 2)
+                           + pow((Y - ({lat})) * {METERS_PER_DEGREE_LAT}, 2)) AS Distance
+            FROM incidents {where}
+        """
+        categories = self._query(f"SELECT Category, count(*) AS Count FROM ({matches}) WHERE Distance <= {radius} "
+                                 "GROUP BY ALL ORDER BY Count DESC, Category", params).df()
+        incidents = self._query(f"SELECT {columns}, Distance FROM ({matches}) WHERE Distance <= {radius} "
+                                f"ORDER BY Distance LIMIT {int(limit)}", params).df()
+        return Nearby(int(categories['Count'].sum()), categories, incidents)
+
+    def _in_city(self):
+        return [f"X BETWEEN {SF_LON_RANGE[0]} AND {SF_LON_RANGE[1]}",
+                f"Y BETWEEN {SF_LAT_RANGE[0]} AND {SF_LAT_RANGE[1]}"]
+
+    def _query(self, sql, params=None):
+        # A cursor per query, since sessions run on separate threads
+        return self._con.cursor().execute(sql, params or [])
+
+    def _fetch_arrow(self, sql, params=None):
+        result = self._query(sql, params).arrow()
+        # Newer DuckDB releases return a batch reader rather than a table
+        return result.read_all() if hasattr(result, 'read_all') else result
+
+    def _where(self, filters, clauses=()):
+        clauses, params = list(clauses), []
+        if filters.start and 'Dates' in self.columns:
+            clauses += ["Dates >= ?", f"{PARTITION_COLUMN} >= ?"]
+            params += [datetime.datetime.combine(filters.start, datetime.time()), filters.start.year]
+        if filters.end and 'Dates' in self.columns:
+            clauses += ["Dates < ?", f"{PARTITION_COLUMN} <= ?"]
+            params += [datetime.datetime.combine(filters.end + datetime.timedelta(days=1), datetime.time()),
+                       filters.end.year]
+        for col, values in (('PdDistrict', filters.districts), ('Category', filters.categories),
+                            ('Resolution', filters.resolutions)):
+            if values and col in self.columns:
+                clauses.append(f"{col} IN ({', '.join('?' * len(values))})")
+                params += list(values)
+        if tuple(filters.hours) != (0, 23) and 'Hour' in self.columns:
+            clauses.append("Hour BETWEEN ? AND ?")
+            params += list(filters.hours)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _with_schema(self, table):
+        """Convert a cube result to the dtypes of one built by ``aggregates.build_cube``."""
+        # Dictionary-encoding in Arrow hands pandas codes instead of per-row strings
+        for i, field in enumerate(table.schema):
+            if pa.types.is_string(field.type):
+                table = table.set_column(i, field.name, pc.dictionary_encode(table.column(i)))
+        cube = table.to_pandas()
+        for col in ('Category', 'PdDistrict'):
+            if col in cube.columns:
+                cube[col] = cube[col].cat.set_categories(self.values(col))
+        if 'DayOfWeek' in cube.columns:
+            cube['DayOfWeek'] = cube['DayOfWeek'].astype(DAY_DTYPE)
+        return apply_schema(cube).astype({'Count': 'int64'})
+
+
+def write_partitioned(source, root, chunksize=CHUNK_ROWS):
+    """Convert a CSV into Parquet files under ``root`` partitioned by year.
+
+    The CSV goes through ``ChunkedIngest`` without keeping its rows, so each
+    chunk is prepared, deduplicated and written before the next is read.
+    Returns the number of rows written.
+    """
+    ingest = ChunkedIngest(source, chunksize=chunksize, keep_rows=False)
+    partitioning = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.int16())]), flavor='hive')
+    part = 0
+    while not ingest.done:
+        chunk = ingest.read_chunk()
+        if chunk is None or not len(chunk):
+            continue
+        ds.write_dataset(pa.Table.from_pandas(chunk, preserve_index=False), root, format='parquet',
+                         partitioning=partitioning, basename_template=f'part-{part:05d}-{{i}}.parquet',
+                         existing_data_behavior='overwrite_or_ignore')
+        part += 1
+    return ingest.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert an incident CSV to year-partitioned Parquet.")
+    parser.add_argument('csv', help="incident CSV to convert")
+    parser.add_argument('root', help="output directory; must be empty or missing")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS, help="rows parsed per chunk (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.root) and os.listdir(args.root):
+        parser.error(f"{args.root} is not empty")
+    rows = write_partitioned(args.csv, args.root, args.chunksize)
+    print(f"Wrote {rows:,} rows to {args.root}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
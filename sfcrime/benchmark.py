@@ -0,0 +1,234 @@
+"""Headless benchmarks for the dashboard's load, transform and aggregation paths.
+
+Run with ``python -m sfcrime.benchmark``; see ``--help`` for options.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from sfcrime.aggregates import (build_cube, category_counts, category_district_crosstab,
+                                category_hour_counts, custom_counts, day_of_week_counts,
+                                district_counts, hour_counts, month_counts)
+from sfcrime import backend, charts
+from sfcrime.crosstab import SparseCrosstab
+from sfcrime.data import load_dataset, prepare_frame
+from sfcrime.filters import BitmapIndex, Filters, filtered_cube
+from sfcrime.ingest import ingest_csv
+from sfcrime.model import DEFAULT_PARAMS, model_path, train_or_load
+from sfcrime.render import compact_figure, payload_bytes
+from sfcrime.spatial import SpatialIndex, bin_by_zoom, nearby_result
+from sfcrime.store import IncidentStore
+from sfcrime.synthetic import synthetic_incidents, write_synthetic_csv
+from sfcrime.timeseries import DailySeries, trend_series
+
+DEFAULT_ROWS = [100_000, 1_000_000, 10_000_000]
+
+# Dimensions offered by the Custom Analysis builder
+CUSTOM_DIMENSIONS = ['Category', 'PdDistrict', 'Hour', 'DayOfWeek']
+
+
+def measure(fn, repeat=3, trace=True):
+    """Best wall time of ``repeat`` calls, then one traced call for the peak allocation.
+
+    Returns ``(result, seconds, peak_bytes)``. The peak covers Python, NumPy and
+    pandas allocations; buffers owned by Arrow's memory pool are not traced.
+    Without ``trace`` the result comes from a last timed call and the peak is
+    None, for steps that crash when run on other threads under ``tracemalloc``.
+    """
+    seconds = float('inf')
+    for _ in range(repeat if trace else repeat - 1):
+        start = time.perf_counter()
+        fn()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    if not trace:
+        start = time.perf_counter()
+        result = fn()
+        return result, min(seconds, time.perf_counter() - start), None
+
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def custom_analysis(cube):
+    for x_axis in CUSTOM_DIMENSIONS:
+        for color_by in [None] + CUSTOM_DIMENSIONS:
+            if color_by != x_axis:
+                custom_counts(cube, x_axis, color_by)
+                custom_counts(cube, x_axis, color_by, percentage=True)
+
+
+# A selection the cube can answer, and one that needs the row bitmaps
+CUBE_FILTER = Filters(districts=('MISSION', 'TENDERLOIN'), hours=(18, 23))
+ROW_FILTER = Filters(districts=('MISSION', 'TENDERLOIN'), resolutions=('NONE',), hours=(18, 23))
+
+
+def aggregation_steps(df, cube, index):
+    """The per-tab computations, as ``(name, callable)`` pairs."""
+    return [
+        ('filter_cube_slice', lambda: filtered_cube(df, cube, index, CUBE_FILTER)),
+        ('filter_bitmap_mask', lambda: index.mask(ROW_FILTER)),
+        ('filter_bitmap_cube', lambda: filtered_cube(df, cube, index, ROW_FILTER)),
+        ('category_counts', lambda: category_counts(cube, 15)),
+        ('district_counts', lambda: district_counts(cube)),
+        ('map_bins_zoom11', lambda: bin_by_zoom(df, 11)),
+        ('map_bins_zoom15', lambda: bin_by_zoom(df, 15)),
+        ('hour_series', lambda: hour_counts(cube)),
+        ('day_of_week_series', lambda: day_of_week_counts(cube)),
+        ('month_series', lambda: month_counts(cube)),
+        ('category_district_crosstab', lambda: category_district_crosstab(cube, 10)),
+        ('category_hour_counts', lambda: category_hour_counts(cube, 10)),
+        ('custom_analysis_all_pairs', lambda: custom_analysis(cube)),
+        ('daily_series_by_category', lambda: DailySeries.from_frame(df, 'Category', mask=index.mask(ROW_FILTER))),
+    ]
+
+
+def chart_steps(cube, bins, series, nearby):
+    """The heaviest figures the app draws, as ``(name, callable)`` pairs."""
+    return [
+        ('chart_category_bar', lambda: charts.category_chart(cube, 15, 'Bar Chart', charts.PALETTES[0])),
+        ('chart_map_zoom15', lambda: charts.district_map(bins, 'open-street-map', 15)),
+        ('chart_nearby_1000m', lambda: charts.nearby_map(nearby, (-122.4194, 37.7749), 1000, 'open-street-map')),
+        ('chart_trend_daily_top10', lambda: charts.trend_chart(series, 'Category', 'Daily', 1, None, None, 10, '#483D8B', 2)),
+        ('chart_heatmap_top10', lambda: charts.category_district_chart(cube, 10, 'Heatmap')),
+    ]
+
+
+def run_benchmarks(rows_list, repeat=3, include_load=True, log=print):
+    results = []
+
+    def record(step, rows, fn, step_repeat=repeat, trace=True):
+        result, seconds, peak = measure(fn, step_repeat, trace)
+        peak_mb = None if peak is None else peak / 1024 ** 2
+        results.append({'step': step, 'rows': rows, 'seconds': seconds, 'peak_mb': peak_mb})
+        memory = f"{'-':>9}" if peak_mb is None else f"{peak_mb:9.1f}"
+        log(f"{rows:>12,}  {step:<28} {seconds:9.4f}s  {memory} MB")
+        return result
+
+    for rows in rows_list:
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = synthetic_incidents(rows)
+            df = record('prepare_frame', rows, lambda: prepare_frame(raw.copy()), 1)
+
+            if include_load:
+                csv_path = write_synthetic_csv(os.path.join(tmp, 'incidents.csv'), rows)
+                warm_dir = os.path.join(tmp, 'warm')
+                # Cold loads get a fresh cache directory every call
+                record('load_csv_cold', rows,
+                       lambda: load_dataset(csv_path, cache_dir=tempfile.mkdtemp(dir=tmp)), 1)
+                load_dataset(csv_path, cache_dir=warm_dir)
+                record('load_columnar_warm', rows, lambda: load_dataset(csv_path, cache_dir=warm_dir))
+                record('ingest_upload_chunked', rows, lambda: ingest_csv(csv_path), 1)
+                # A daily batch of 1% new rows on top of the stored history
+                store = IncidentStore(os.path.join(tmp, 'store'))
+                store.append(csv_path)
+                batch_path = write_synthetic_csv(os.path.join(tmp, 'batch.csv'), max(rows // 100, 1), seed=1)
+                record('store_append_1pct', rows, lambda: store.append(batch_path), 1)
+                if backend.duckdb is not None:
+                    # Arrow and DuckDB work on their own threads, which crash under
+                    # tracemalloc, so these steps are timed without a peak
+                    parquet_root = os.path.join(tmp, 'parquet')
+                    record('parquet_export', rows, lambda: backend.write_partitioned(csv_path, parquet_root), 1,
+                           trace=False)
+                    parquet = backend.ParquetBackend(parquet_root)
+                    record('parquet_cube', rows, lambda: parquet.cube(), trace=False)
+                    record('parquet_filter_cube', rows, lambda: parquet.cube(ROW_FILTER), trace=False)
+                    record('parquet_map_bins_zoom15', rows, lambda: parquet.map_bins(15), trace=False)
+            del raw
+
+            cube = record('build_cube', rows, lambda: build_cube(df))
+            index = record('bitmap_index', rows, lambda: BitmapIndex(df))
+            for step, fn in aggregation_steps(df, cube, index):
+                record(step, rows, fn)
+            # The sparse crosstab is counted once; every heatmap and drill-down is answered from it
+            crosstab = record('crosstab_build', rows, lambda: SparseCrosstab.from_frame(df))
+            results[-1]['nonzero_cells'] = crosstab.matrix.nnz
+            top_category = crosstab.categories()[0]
+            record('crosstab_category_day_hour', rows, lambda: crosstab.counts(('DayOfWeek', 'Hour')))
+            record('crosstab_descript_dist_hour', rows,
+                   lambda: crosstab.counts(('PdDistrict', 'Hour'), 'Descript', top_n=200))
+            record('crosstab_drilldown_district', rows,
+                   lambda: crosstab.counts(('PdDistrict',), category=top_category))
+            spatial_index = record('spatial_index', rows, lambda: SpatialIndex.from_frame(df))
+            record('radius_250m_downtown', rows, lambda: spatial_index.within(-122.4194, 37.7749, 250))
+            record('radius_1000m_downtown', rows, lambda: spatial_index.within(-122.4194, 37.7749, 1000))
+            record('nearest_10', rows, lambda: spatial_index.nearest(-122.4194, 37.7749, 10))
+            series = DailySeries.from_frame(df, 'Category')
+            record('trend_daily_rolling_top10', rows, lambda: trend_series(series, 'D', 7, top_n=10))
+            record('trend_monthly_all', rows, lambda: trend_series(series, 'M'))
+
+            # Figure build plus compaction, with the JSON sent to the browser before and after
+            nearby = nearby_result(df, *spatial_index.within(-122.4194, 37.7749, 1000), 1000)
+            for step, build in chart_steps(cube, bin_by_zoom(df, 15), series, nearby):
+                fig = record(step, rows, lambda: compact_figure(build()))
+                results[-1]['payload_kb'] = payload_bytes(fig) / 1024
+                results[-1]['uncompacted_kb'] = payload_bytes(build()) / 1024
+                log(f"{'':>12}  payload {results[-1]['uncompacted_kb']:,.1f} KB -> {results[-1]['payload_kb']:,.1f} KB")
+
+            # Training on a fresh cache every call, a cache hit, and scoring every row
+            model_dir = os.path.join(tmp, 'models')
+            model = record('model_train', rows, lambda: train_or_load(df, dataset_key=str(rows),
+                                                                      model_dir=tempfile.mkdtemp(dir=tmp)), 1)
+            model.save(model_path(str(rows), DEFAULT_PARAMS, model_dir))
+            model_mb = os.path.getsize(model_path(str(rows), DEFAULT_PARAMS, model_dir)) / 1024 ** 2
+            results[-1]['model_mb'] = model_mb
+            record('model_load_cached', rows, lambda: train_or_load(df, dataset_key=str(rows), model_dir=model_dir))
+            record('model_predict', rows, lambda: model.predict(df), 1)
+            results[-1]['rows_per_second'] = rows / results[-1]['seconds']
+            log(f"{'':>12}  model of {model_mb:.1f} MB scores {results[-1]['rows_per_second']:,.0f} rows/s")
+
+    return results
+
+
+def find_regressions(results, baseline, tolerance):
+    """Steps whose time grew by more than ``tolerance`` (a fraction) over ``baseline``."""
+    previous = {(r['step'], r['rows']): r['seconds'] for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get((r['step'], r['rows']))
+        if before is not None and r['seconds'] > before * (1 + tolerance):
+            regressions.append({**r, 'baseline_seconds': before})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="dataset sizes to benchmark (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per step; the best is kept")
+    parser.add_argument('--skip-load', action='store_true', help="skip the CSV write/parse steps")
+    parser.add_argument('--output', help="write the results as JSON to this path")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown against the baseline before failing (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.rows, args.repeat, include_load=not args.skip_load)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            print(pd.DataFrame(regressions).to_string(index=False))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""Plotly figures for each dashboard view, built from the aggregate cube."""
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from sfcrime.aggregates import (category_counts, category_district_crosstab, category_hour_counts,
+                                custom_counts, day_of_week_counts, district_counts, hour_counts,
+                                month_counts)
+from sfcrime.spatial import METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON
+from sfcrime.timeseries import FREQUENCIES, trend_series
+
+# Display names of the dimension columns used as axes and legends
+COLUMN_LABELS = {'PdDistrict': 'District', 'Hour': 'Hour', 'DayOfWeek': 'Day of Week'}
+
+PALETTES = ["Plotly", "D3", "G10", "T10", "Alphabet", "Dark24", "Light24",
+            "Set1", "Set2", "Set3", "Pastel1", "Pastel2", "Paired"]
+
+
+def palette_colors(name):
+    return px.colors.qualitative.__dict__.get(name, px.colors.qualitative.Plotly)
+
+
+def category_chart(cube, top_n, chart_type, palette):
+    top_crimes_df = category_counts(cube, top_n)
+
+    if chart_type == "Bar Chart":
+        fig = px.bar(
+            top_crimes_df,
+            x='Category',
+            y='Count',
+            color='Category',
+            color_discrete_sequence=palette_colors(palette),
+            labels={'Count': 'Number of Incidents', 'Category': 'Crime Category'},
+            title=f'Top {top_n} Crime Categories'
+        )
+        fig.update_layout(xaxis_tickangle=-45)
+
+    elif chart_type == "Horizontal Bar":
+        fig = px.bar(
+            top_crimes_df,
+            x='Count',
+            y='Category',
+            color='Category',
+            color_discrete_sequence=palette_colors(palette),
+            labels={'Count': 'Number of Incidents', 'Category': 'Crime Category'},
+            title=f'Top {top_n} Crime Categories',
+            orientation='h'
+        )
+
+    else:  # Treemap
+        fig = px.treemap(
+            top_crimes_df,
+            path=['Category'],
+            values='Count',
+            color='Count',
+            color_continuous_scale=palette_colors(palette),
+            title=f'Top {top_n} Crime Categories'
+        )
+    return fig
+
+
+def district_chart(cube, viz_type, palette, donut=False, sort_order="Descending"):
+    district_df = district_counts(cube)
+
+    if viz_type == "Pie Chart":
+        fig = px.pie(
+            district_df,
+            names='District',
+            values='Count',
+            title='Crime Distribution by District',
+            color_discrete_sequence=palette_colors(palette)
+        )
+
+        if donut:
+            fig.update_traces(hole=0.4)
+
+        fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5))
+        return fig
+
+    # Bar Chart
+    if sort_order == "Descending":
+        district_df = district_df.sort_values('Count', ascending=False)
+    elif sort_order == "Ascending":
+        district_df = district_df.sort_values('Count', ascending=True)
+    else:  # Alphabetical
+        district_df = district_df.sort_values('District')
+
+    fig = px.bar(
+        district_df,
+        x='District',
+        y='Count',
+        color='District',
+        title='Crime by District',
+        color_discrete_sequence=palette_colors(palette)
+    )
+    fig.update_layout(xaxis_tickangle=-45)
+    return fig
+
+
+def district_map(location_counts, map_style, zoom):
+    """Map of grid-binned incidents, one marker per cell colored by its most frequent category."""
+    fig = px.scatter_mapbox(
+        location_counts,
+        lat="Y",  # Y coordinate as latitude
+        lon="X",  # X coordinate as longitude
+        color="Category",
+        size="Count",
+        custom_data=["Count", "CategoryShare"],
+        zoom=zoom,
+        height=600,
+        title="Crime Hotspots in San Francisco"
+    )
+    # Each trace is one category, so its name is shown instead of sending it with every cell
+    fig.update_traces(hovertemplate="<b>%{fullData.name}</b><br>Count=%{customdata[0]}"
+                                    "<br>Share of cell=%{customdata[1]:.0%}<extra></extra>")
+
+    fig.update_layout(
+        mapbox_style=map_style,
+        mapbox_center={"lat": 37.7749, "lon": -122.4194},  # San Francisco coordinates
+        margin={"r": 0, "t": 30, "l": 0, "b": 0}
+    )
+    return fig
+
+
+def nearby_map(nearby, location, radius, map_style):
+    """The incidents found by a radius search, with the search circle around ``location``."""
+    lon, lat = location
+    fig = px.scatter_mapbox(
+        nearby.incidents,
+        lat="Y",
+        lon="X",
+        color="Category",
+        custom_data=["Address", "Dates", "Distance"],
+        height=500
+    )
+    fig.update_traces(hovertemplate="<b>%{fullData.name}</b><br>Address=%{customdata[0]}"
+                                    "<br>Dates=%{customdata[1]}<br>Meters away=%{customdata[2]:.0f}<extra></extra>")
+
+    angles = np.linspace(0, 2 * np.pi, 73)
+    fig.add_trace(go.Scattermapbox(
+        lon=lon + radius / METERS_PER_DEGREE_LON * np.cos(angles),
+        lat=lat + radius / METERS_PER_DEGREE_LAT * np.sin(angles),
+        mode='lines',
+        line=dict(color='#1E3A8A', width=2),
+        hoverinfo='skip',
+        name=f'{radius} m'
+    ))
+
+    # About 124 km per 256px tile at zoom 0 at this latitude; fit the circle's
+    # diameter in roughly 400 of the map's 500 pixels
+    zoom = float(np.clip(np.log2(24_000_000 / radius), 10, 18))
+    fig.update_layout(
+        mapbox_style=map_style,
+        mapbox_center={"lat": lat, "lon": lon},
+        mapbox_zoom=zoom,
+        margin={"r": 0, "t": 30, "l": 0, "b": 0}
+    )
+    return fig
+
+
+def time_chart(cube, time_analysis, line_color, marker_color, marker_size, line_width):
+    """Incident counts folded by hour of day, day of week or month."""
+    if time_analysis == "Hour of Day":
+        counts = hour_counts(cube)
+        x, title = counts['Hour'], 'Crime Incidents by Hour of Day'
+        xaxis = dict(title='Hour (24-hour format)', tickmode='linear', tick0=0, dtick=1)
+    elif time_analysis == "Day of Week":
+        counts = day_of_week_counts(cube)
+        x, title = counts['DayOfWeek'], 'Crime Incidents by Day of Week'
+        xaxis = dict(title='Day of Week')
+    else:  # Month
+        counts = month_counts(cube)
+        x, title = counts['Month'], 'Crime Incidents by Month'
+        xaxis = dict(title='Month')
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=x,
+        y=counts['Count'],
+        mode='lines+markers',
+        line=dict(color=line_color, width=line_width),
+        marker=dict(color=marker_color, size=marker_size),
+        name='Incidents'
+    ))
+
+    fig.update_layout(
+        title=title,
+        xaxis=xaxis,
+        yaxis=dict(title='Number of Incidents'),
+        hovermode='x',
+        plot_bgcolor='rgba(240, 240, 240, 0.5)'
+    )
+    return fig
+
+
+def trend_chart(series, group_by, granularity, window, start, end, top_n, line_color, line_width):
+    """Incidents over time at ``granularity``, one line per group of the daily ``series``.
+
+    ``series`` is split by the ``group_by`` column (``None`` for one line).
+    Each line is smoothed by a ``window``-period rolling average and
+    downsampled before plotting.
+    """
+    traces = trend_series(series, FREQUENCIES[granularity], window, start, end, top_n)
+    single = len(series.labels) == 1
+
+    fig = go.Figure()
+    for label, dates, values in traces:
+        fig.add_trace(go.Scatter(
+            x=dates,
+            y=values,
+            mode='lines',
+            line=dict(color=line_color if single else None, width=line_width),
+            name=str(label)
+        ))
+
+    title = f'{granularity} Crime Incidents'
+    if window > 1:
+        title += f' ({window}-period rolling average)'
+    fig.update_layout(
+        title=title,
+        xaxis=dict(title='Date'),
+        yaxis=dict(title='Number of Incidents'),
+        hovermode='x',
+        legend_title_text=COLUMN_LABELS.get(group_by, group_by),
+        showlegend=not single,
+        plot_bgcolor='rgba(240, 240, 240, 0.5)'
+    )
+    return fig
+
+
+def prediction_chart(counts):
+    """Predicted next to actual incidents per category, from ``prediction_summary``."""
+    long = counts.melt(id_vars='Category', value_vars=['Actual', 'Predicted'],
+                       var_name='Source', value_name='Count')
+    fig = px.bar(
+        long,
+        x='Category',
+        y='Count',
+        color='Source',
+        barmode='group',
+        title='Predicted vs Actual Incidents by Category',
+        labels={'Count': 'Number of Incidents'}
+    )
+    fig.update_layout(xaxis_tickangle=-45)
+    return fig
+
+
+def category_district_chart(cube, top_n, viz_option):
+    pivot_df = category_district_crosstab(cube, top_n)
+
+    if viz_option == "Heatmap":
+        fig = px.imshow(
+            pivot_df,
+            color_continuous_scale='RdBu_r',
+            aspect="auto",
+            labels=dict(x="District", y="Crime Category", color="Count")
+        )
+        fig.update_layout(height=500)
+        return fig
+
+    fig = px.bar(
+        pivot_df.reset_index().melt(id_vars='Category', var_name='District', value_name='Count'),
+        x='District',
+        y='Count',
+        color='Category',
+        barmode='stack',
+        labels={'Count': 'Number of Incidents'}
+    )
+    fig.update_layout(xaxis_tickangle=-45)
+    return fig
+
+
+def crosstab_chart(crosstab, columns, rows, category, top_n, normalize):
+    """Heatmap of a ``SparseCrosstab``: categories, descriptions or one category's descriptions.
+
+    With two ``columns`` dimensions the x axis is grouped by the first.
+    """
+    table = crosstab.counts(columns, rows, category, top_n, normalize)
+    x = table.columns.tolist() if len(columns) == 1 else [list(level) for level in zip(*table.columns)]
+    row_label = "Crime Category" if table.index.name == 'Category' else "Description"
+    value_label = "Share of row" if normalize else "Count"
+
+    fig = go.Figure(go.Heatmap(
+        z=table.to_numpy(),
+        x=x,
+        y=table.index.tolist(),
+        colorscale='RdBu_r',
+        colorbar=dict(title=value_label),
+        hovertemplate=f"{row_label}=%{{y}}<br>{' / '.join(columns)}=%{{x}}<br>{value_label}=%{{z"
+                      f"{':.1%' if normalize else ''}}}<extra></extra>"
+    ))
+    if category:
+        title = f"Descriptions of {category}"
+    elif rows == 'Descript':
+        title = f"Top {len(table)} Descriptions"
+    else:
+        title = "Crime Categories"
+    fig.update_layout(
+        title=f"{title} by {' and '.join(COLUMN_LABELS[dim] for dim in columns)}",
+        yaxis=dict(title=row_label, autorange='reversed'),
+        # Tall enough for every row label
+        height=max(400, 150 + 16 * len(table))
+    )
+    return fig
+
+
+def category_hour_chart(cube, top_n):
+    hour_cat_df = category_hour_counts(cube, top_n)
+
+    fig = px.line(
+        hour_cat_df,
+        x='Hour',
+        y='Count',
+        color='Category',
+        labels={'Count': 'Number of Incidents', 'Hour': 'Hour of Day'},
+        title=f'Crime Patterns Throughout the Day for Top {top_n} Categories'
+    )
+
+    fig.update_layout(
+        xaxis=dict(tickmode='linear', tick0=0, dtick=1),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5)
+    )
+    return fig
+
+
+def custom_chart(cube, x_axis, y_axis, color_by=None):
+    """Bar chart for the Custom Analysis builder; ``y_axis`` is 'Count' or 'Percentage'."""
+    percentage = y_axis == 'Percentage'
+    count_df = custom_counts(cube, x_axis, color_by, percentage=percentage)
+
+    title = f'Crime Incidents by {x_axis}' if color_by is None else f'Crime Incidents by {x_axis} and {color_by}'
+    fig = px.bar(
+        count_df,
+        x=x_axis,
+        y=y_axis,
+        color=color_by,
+        title=f'{title} (%)' if percentage else title
+    )
+    fig.update_layout(xaxis_tickangle=-45)
+    return fig
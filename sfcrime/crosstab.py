@@ -0,0 +1,135 @@
+"""Sparse crosstabs of incident counts over high-cardinality categorical codes."""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from sfcrime.aggregates import dimension_codes
+from sfcrime.parallel import count_combinations
+
+# Rows are (category, description) pairs, kept grouped by category for drill-down
+ROW_DIMENSIONS = ['Category', 'Descript']
+
+# Columns are the cells of the district x hour x weekday grid
+COLUMN_DIMENSIONS = ['PdDistrict', 'Hour', 'DayOfWeek']
+
+CROSSTAB_DIMENSIONS = ROW_DIMENSIONS + COLUMN_DIMENSIONS
+
+
+class SparseCrosstab:
+    """Incidents per category and description across every district, hour and weekday.
+
+    ``matrix`` is a CSR matrix with one row per observed (category,
+    description) pair, ordered by category, and one column per cell of the
+    district x hour x weekday grid; only non-zero counts are stored. Totals by
+    category or description and projections onto fewer column dimensions are
+    sparse products, and the descriptions of one category are a contiguous
+    slice of rows, so drilling down neither rescans the incidents nor
+    densifies more than the table being shown.
+    """
+
+    def __init__(self, matrix, row_categories, row_descriptions, levels):
+        self.matrix = matrix
+        self.row_categories = row_categories
+        self.row_descriptions = row_descriptions
+        self.levels = levels
+        self.column_shape = tuple(len(levels[dim]) for dim in COLUMN_DIMENSIONS)
+        self._row_totals = {}
+        self._column_totals = np.bincount(matrix.indices, weights=matrix.data, minlength=matrix.shape[1])
+        # The rows of category ``i`` are ``bounds[i]:bounds[i + 1]``
+        self._bounds = np.searchsorted(row_categories, np.arange(len(levels['Category']) + 1))
+
+    @classmethod
+    def from_codes(cls, codes, levels, mask=None, weights=None):
+        """Build from a code array and labels per ``CROSSTAB_DIMENSIONS`` entry, both keyed by dimension.
+
+        Codes are given per row, or per counted cell with ``weights``; rows with
+        a negative code or outside the boolean ``mask`` are not counted.
+        """
+        shape = tuple(len(levels[dim]) for dim in CROSSTAB_DIMENSIONS)
+        cells, counts = count_combinations([codes[dim] for dim in CROSSTAB_DIMENSIONS], shape,
+                                           mask=mask, weights=weights)
+
+        # Cells come back ascending, so they are already in CSR order: grouped by
+        # (category, description) pair with the grid cells ascending within each
+        columns = int(np.prod(shape[len(ROW_DIMENSIONS):]))
+        pairs = cells // columns
+        starts = np.flatnonzero(np.diff(pairs, prepend=-1))
+        indptr = np.append(starts, len(cells))
+        matrix = sparse.csr_matrix((counts, cells % columns, indptr), shape=(len(starts), columns))
+        row_categories, row_descriptions = np.unravel_index(pairs[starts], shape[:len(ROW_DIMENSIONS)])
+        return cls(matrix, row_categories, row_descriptions, levels)
+
+    @classmethod
+    def from_frame(cls, df, mask=None, weights=None):
+        """Count the rows of ``df`` (optionally a boolean ``mask`` of them) in one pass."""
+        codes, levels = {}, {}
+        for dim in CROSSTAB_DIMENSIONS:
+            codes[dim], levels[dim] = dimension_codes(df[dim])
+        return cls.from_codes(codes, levels, mask, weights)
+
+    @property
+    def total(self):
+        return int(self.matrix.sum())
+
+    def categories(self):
+        """Categories with incidents, most frequent first."""
+        totals = np.asarray(self._rows_by('Category').sum(axis=1)).ravel()
+        order = np.argsort(-totals, kind='stable')
+        return self.levels['Category'][order[totals[order] > 0]].tolist()
+
+    def counts(self, columns, rows='Category', category=None, top_n=None, normalize=False):
+        """Counts with one column per combination of the ``columns`` dimensions.
+
+        Rows are the categories or, with ``rows='Descript'``, the descriptions;
+        given a ``category``, they are the descriptions of that category only.
+        The ``top_n`` rows with the most incidents are kept, most frequent
+        first, and with ``normalize`` each row is divided by its total.
+        """
+        if category is not None:
+            i = self.levels['Category'].get_loc(category)
+            lo, hi = self._bounds[i], self._bounds[i + 1]
+            rows, table = 'Descript', self.matrix[lo:hi]
+            labels = self.levels['Descript'][self.row_descriptions[lo:hi]]
+        else:
+            table = self._rows_by(rows)
+            labels = self.levels[rows]
+
+        projection = self._projection(columns)
+        table = table @ projection
+        totals = np.asarray(table.sum(axis=1)).ravel()
+        order = np.argsort(-totals, kind='stable')
+        order = order[totals[order] > 0][:top_n]
+        # Columns without any incident, such as hours outside a filter, are left out
+        observed = np.flatnonzero(self._column_totals @ projection)
+
+        # Only the rows being shown are densified
+        values = table[order][:, observed].toarray()
+        if normalize:
+            values = values / totals[order, None]
+        return pd.DataFrame(values, index=pd.Index(labels[order].astype(str), name=rows),
+                            columns=self._column_labels(columns)[observed])
+
+    def _rows_by(self, dim):
+        # Summing the pair rows into one row per category or description is a
+        # product with a sparse 0/1 matrix, kept for the next view
+        if dim not in self._row_totals:
+            codes = self.row_categories if dim == 'Category' else self.row_descriptions
+            pairs = len(codes)
+            indicator = sparse.csr_matrix((np.ones(pairs, dtype=np.int64), (codes, np.arange(pairs))),
+                                          shape=(len(self.levels[dim]), pairs))
+            self._row_totals[dim] = indicator @ self.matrix
+        return self._row_totals[dim]
+
+    def _projection(self, columns):
+        """Sparse 0/1 matrix summing the grid cells into cells of the ``columns`` dimensions."""
+        cell_codes = np.unravel_index(np.arange(int(np.prod(self.column_shape))), self.column_shape)
+        kept = [COLUMN_DIMENSIONS.index(dim) for dim in columns]
+        target = np.ravel_multi_index([cell_codes[i] for i in kept], [self.column_shape[i] for i in kept])
+        return sparse.csr_matrix((np.ones(len(target), dtype=np.int64), (np.arange(len(target)), target)),
+                                 shape=(len(target), int(np.prod([self.column_shape[i] for i in kept]))))
+
+    def _column_labels(self, columns):
+        levels = [self.levels[dim].astype(str) for dim in columns]
+        if len(levels) == 1:
+            return pd.Index(levels[0], name=columns[0])
+        return pd.MultiIndex.from_product(levels, names=list(columns))
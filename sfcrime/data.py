@@ -0,0 +1,175 @@
+"""Loading and columnar caching of the SF crime dataset."""
+import functools
+import glob
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from sfcrime.datetime_features import add_time_features
+
+DEMO_CSV = "train_small.csv"
+CACHE_DIR = os.environ.get("SFCRIME_CACHE_DIR", ".cache")
+
+REQUIRED_COLUMNS = ['Category', 'PdDistrict', 'X', 'Y']
+
+# Bump whenever the derived columns or their dtypes change so old caches get rebuilt
+CACHE_VERSION = 4
+
+# Loading schema: low-cardinality strings become categoricals, time parts and
+# coordinates get the narrowest type that holds them
+CATEGORY_COLUMNS = ['Category', 'PdDistrict', 'Descript', 'Resolution', 'Address', 'DayOfWeek', 'MonthName']
+NUMERIC_DTYPES = {
+    'Hour': 'int8',
+    'Month': 'int8',
+    'Day': 'int8',
+    'Year': 'int16',
+    'X': 'float32',
+    'Y': 'float32',
+}
+CSV_DTYPES = {
+    **{col: 'category' for col in CATEGORY_COLUMNS},
+    'X': 'float32',
+    'Y': 'float32',
+}
+
+
+def file_fingerprint(path, cache_dir=CACHE_DIR):
+    """Return the sha256 of ``path``, reusing the stored digest while size and mtime are unchanged."""
+    stat = os.stat(path)
+    meta_path = os.path.join(cache_dir, os.path.basename(path) + ".meta.json")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["size"] == stat.st_size and meta["mtime_ns"] == stat.st_mtime_ns:
+            return meta["sha256"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _atomic_write_json(meta_path, {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256})
+    return sha256
+
+
+def prepare_frame(df):
+    """Drop duplicate rows, derive the time columns and order the rows by date."""
+    df = df.drop_duplicates().reset_index(drop=True)
+    if 'Dates' in df.columns:
+        df = add_time_features(df)
+        # Date-sorted rows let date ranges be found by binary search
+        df = df.sort_values('Dates', kind='stable', ignore_index=True)
+    return apply_schema(df)
+
+
+def apply_schema(df):
+    """Cast the known columns of ``df`` to the compact loading schema."""
+    dtypes = {col: 'category' for col in CATEGORY_COLUMNS}
+    dtypes.update(NUMERIC_DTYPES)
+    return df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+
+
+def concat_frames(frames):
+    """Concatenate frames, unioning categories so categorical columns stay categorical."""
+    frames = [frame.copy(deep=False) for frame in frames]
+    if len(frames) == 1:
+        return frames[0]
+
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categories = functools.reduce(
+                lambda left, right: left.union(right, sort=False),
+                (frame[col].cat.categories for frame in frames),
+            )
+            for frame in frames:
+                frame[col] = frame[col].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def row_hashes(df):
+    """64-bit content hash of every row, used to spot duplicates across batches."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def memory_report(df):
+    """Per-column memory usage of ``df`` in bytes, largest first."""
+    usage = df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'Column': usage.index,
+        'Dtype': [str(df[col].dtype) for col in usage.index],
+        'Bytes': usage.values,
+    })
+    return report.sort_values('Bytes', ascending=False, ignore_index=True)
+
+
+def columnar_cache_path(csv_path, fingerprint, cache_dir=CACHE_DIR):
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, f"{stem}-v{CACHE_VERSION}-{fingerprint[:16]}.arrow")
+
+
+def build_columnar_cache(csv_path, cache_path):
+    """Parse ``csv_path`` once and store the prepared frame as an uncompressed Arrow file.
+
+    Returns the frame memory-mapped from the new file, like a later load would.
+    """
+    df = prepare_frame(pd.read_csv(csv_path, dtype=CSV_DTYPES))
+
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    write_columnar(df, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+    # Remove caches built from older versions of the CSV
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    for stale in glob.glob(os.path.join(os.path.dirname(cache_path), f"{stem}-v*.arrow")):
+        if stale != cache_path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    return read_columnar(cache_path)
+
+
+def write_columnar(df, sink):
+    """Write ``df`` as an Arrow file that ``read_columnar`` can map without copying.
+
+    Uncompressed so the buffers are used as stored, and written as a single
+    record batch so every column is contiguous; a column split over Arrow's
+    default 64k-row batches is concatenated into a private copy on read.
+    """
+    feather.write_feather(df, sink, compression="uncompressed", chunksize=max(len(df), 1))
+
+
+def read_columnar(cache_path):
+    """Frame whose columns are read-only views of the memory-mapped Arrow file.
+
+    The pages belong to the OS file cache rather than to this process, so
+    every session and every server process reading the same file shares one
+    copy of the data. Each column keeps its own block so that pandas does not
+    consolidate them into a copy, and writing to the frame raises
+    ``ValueError``. Files with several record batches are still read, as a copy.
+    """
+    return feather.read_table(cache_path, memory_map=True).to_pandas(split_blocks=True)
+
+
+def load_dataset(csv_path=DEMO_CSV, cache_dir=CACHE_DIR):
+    """Load ``csv_path`` through its columnar cache, building the cache on first use."""
+    cache_path = columnar_cache_path(csv_path, file_fingerprint(csv_path, cache_dir), cache_dir)
+    if os.path.exists(cache_path):
+        return read_columnar(cache_path)
+    return build_columnar_cache(csv_path, cache_path)
+
+
+def _atomic_write_json(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
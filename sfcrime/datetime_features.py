@@ -0,0 +1,70 @@
+"""Fast parsing of incident timestamps and the calendar features derived from them."""
+import calendar
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Layout of the Dates column in SFPD exports
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DAY_ORDER = list(calendar.day_name)
+MONTH_ORDER = list(calendar.month_name)[1:]
+DAY_DTYPE = pd.CategoricalDtype(DAY_ORDER, ordered=True)
+MONTH_DTYPE = pd.CategoricalDtype(MONTH_ORDER, ordered=True)
+
+
+def parse_dates(values):
+    """Parse ``values`` with the SFPD layout, falling back to format inference for other layouts.
+
+    Values that do not parse become NaT. The result is always ``datetime64[s]``,
+    whichever parser ran, so that row hashes do not depend on it.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    try:
+        parsed = pc.strptime(pa.array(values, type=pa.string()), format=DATE_FORMAT, unit='s',
+                             error_is_null=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        parsed = None
+    if parsed is None or parsed.null_count == len(parsed):
+        # Nothing is in the SFPD layout
+        return pd.to_datetime(values, errors='coerce').astype('datetime64[s]')
+    return pd.Series(parsed.to_numpy(zero_copy_only=False), index=values.index, name=values.name)
+
+
+def time_features(dates):
+    """Calendar features of a datetime Series as narrow integer codes and ordered categoricals.
+
+    Everything is computed with integer arithmetic on the underlying datetime64
+    values; the day and month names are categoricals over fixed label lists, so
+    no per-row strings are built. ``dates`` must not contain NaT.
+    """
+    values = dates.to_numpy(dtype='datetime64[s]')
+    seconds = values.view('i8')
+    days = values.astype('datetime64[D]')
+    months = values.astype('datetime64[M]')
+
+    # 1970-01-01 was a Thursday; shift so Monday is 0
+    weekday = (days.view('i8') + 3) % 7
+    month = months.view('i8') % 12
+
+    return {
+        'Hour': (seconds // 3600 % 24).astype(np.int8),
+        'Month': (month + 1).astype(np.int8),
+        'Year': (values.astype('datetime64[Y]').view('i8') + 1970).astype(np.int16),
+        'Day': ((days - months.astype('datetime64[D]')).view('i8') + 1).astype(np.int8),
+        'DayOfWeek': pd.Categorical.from_codes(weekday, dtype=DAY_DTYPE),
+        'MonthName': pd.Categorical.from_codes(month, dtype=MONTH_DTYPE),
+    }
+
+
+def add_time_features(df, column='Dates'):
+    """Parse ``column`` and add the derived calendar columns; rows without a date are dropped."""
+    df[column] = parse_dates(df[column])
+    if df[column].isna().any():
+        df = df[df[column].notna()].reset_index(drop=True)
+    for name, values in time_features(df[column]).items():
+        df[name] = values
+    return df
@@ -0,0 +1,163 @@
+"""Global incident filters backed by per-value bitmap indexes."""
+import calendar
+import collections
+import datetime
+
+import numpy as np
+
+from sfcrime.aggregates import build_cube, dimension_codes
+
+# Categorical columns that get one bitmap per value
+BITMAP_COLUMNS = ['PdDistrict', 'Category', 'Resolution', 'Hour']
+
+# Date-sorted runs searched one by one; rows split into more runs are compared directly
+MAX_DATE_RUNS = 64
+
+
+class Filters(collections.namedtuple(
+        'Filters', ['start', 'end', 'districts', 'categories', 'resolutions', 'hours'],
+        defaults=(None, None, (), (), (), (0, 23)))):
+    """A filter selection; empty value tuples and ``None`` dates mean "no restriction".
+
+    ``start`` and ``end`` are inclusive ``datetime.date`` bounds and ``hours`` an
+    inclusive ``(first, last)`` hour window. Being a tuple, a selection can be
+    used directly as part of a cache key.
+    """
+    __slots__ = ()
+
+    @property
+    def active(self):
+        return self != Filters()
+
+    def cube_compatible(self):
+        """Whether the aggregate cube alone can answer this selection.
+
+        The cube keeps Category, PdDistrict, Hour, Month and Year, so anything
+        finer-grained (resolutions, dates inside a month) needs the row index.
+        """
+        if self.resolutions:
+            return False
+        starts_on_month = self.start is None or self.start.day == 1
+        ends_on_month = self.end is None or self.end.day == calendar.monthrange(self.end.year, self.end.month)[1]
+        return starts_on_month and ends_on_month
+
+
+class BitmapIndex:
+    """Packed per-value bitmaps over the rows of a frame.
+
+    Each value of the ``BITMAP_COLUMNS`` gets a bitmap with one bit per row, so
+    combining filters is a bitwise OR within a column and AND across columns on
+    arrays an eighth the size of a boolean mask. Date ranges are resolved by
+    binary search within each date-sorted run of rows, such as the batches
+    of an appended store, as long as there are few runs.
+    """
+
+    def __init__(self, df, columns=BITMAP_COLUMNS):
+        self.rows = len(df)
+        self.bitmaps = {}
+        # Rows with a value, for the columns where some are missing
+        self._present = {}
+        for col in columns:
+            if col in df.columns:
+                codes, levels = dimension_codes(df[col])
+                self.bitmaps[col] = {level: np.packbits(codes == i) for i, level in enumerate(levels)}
+                if (codes < 0).any():
+                    self._present[col] = np.packbits(codes >= 0)
+
+        self._dates = None
+        if 'Dates' in df.columns:
+            self._dates = df['Dates'].to_numpy(dtype='datetime64[s]')
+            # Start of every date-sorted run, and the end of the last
+            breaks = np.flatnonzero(self._dates[1:] < self._dates[:-1]) + 1
+            self._runs = np.concatenate([[0], breaks, [self.rows]]) if len(breaks) < MAX_DATE_RUNS else None
+
+    def values(self, col):
+        return list(self.bitmaps.get(col, {}))
+
+    def date_bounds(self):
+        if self._dates is None or not self.rows:
+            return None
+        if self._runs is not None:
+            first, last = self._dates[self._runs[:-1]].min(), self._dates[self._runs[1:] - 1].max()
+        else:
+            first, last = self._dates.min(), self._dates.max()
+        return first.astype('datetime64[D]').astype(datetime.date), last.astype('datetime64[D]').astype(datetime.date)
+
+    def select(self, col, values):
+        """Packed bitmap of rows whose ``col`` is any of ``values``."""
+        bitmaps = self.bitmaps[col]
+        values = set(values)
+        chosen = [bitmap for value, bitmap in bitmaps.items() if value in values]
+        # When most values are selected, clear the few unselected ones instead;
+        # rows missing a value are in no bitmap, so they are cleared too
+        if len(chosen) > len(bitmaps) / 2:
+            rest = [bitmap for value, bitmap in bitmaps.items() if value not in values]
+            selected = ~self._union(rest)
+            if col in self._present:
+                selected &= self._present[col]
+            return selected
+        return self._union(chosen)
+
+    def date_range(self, start, end):
+        """Packed bitmap of rows dated from ``start`` through ``end`` (inclusive dates)."""
+        lo = np.datetime64(start or datetime.date.min, 's')
+        hi = np.datetime64(end or datetime.date.max - datetime.timedelta(days=1), 's') + np.timedelta64(1, 'D')
+        if self._runs is not None:
+            selected = np.zeros(self.rows, dtype=bool)
+            for start, stop in zip(self._runs[:-1], self._runs[1:]):
+                first, last = start + np.searchsorted(self._dates[start:stop], [lo, hi])
+                selected[first:last] = True
+        else:
+            selected = (self._dates >= lo) & (self._dates < hi)
+        return np.packbits(selected)
+
+    def mask(self, filters):
+        """Boolean row mask for ``filters``, or None when nothing is filtered."""
+        parts = []
+        if (filters.start or filters.end) and self._dates is not None:
+            parts.append(self.date_range(filters.start, filters.end))
+        for col, values in (('PdDistrict', filters.districts), ('Category', filters.categories),
+                            ('Resolution', filters.resolutions)):
+            if values and col in self.bitmaps:
+                parts.append(self.select(col, values))
+        if tuple(filters.hours) != (0, 23) and 'Hour' in self.bitmaps:
+            first, last = filters.hours
+            parts.append(self.select('Hour', [h for h in self.bitmaps['Hour'] if first <= h <= last]))
+
+        if not parts:
+            return None
+        packed = np.bitwise_and.reduce(parts) if len(parts) > 1 else parts[0]
+        return np.unpackbits(packed, count=self.rows).view(bool)
+
+    def _union(self, bitmaps):
+        if not bitmaps:
+            return np.zeros((self.rows + 7) // 8, dtype=np.uint8)
+        return np.bitwise_or.reduce(bitmaps) if len(bitmaps) > 1 else bitmaps[0].copy()
+
+
+def filter_cube(cube, filters):
+    """Restrict the cube to a selection that ``Filters.cube_compatible`` accepts."""
+    keep = np.ones(len(cube), dtype=bool)
+    if filters.districts:
+        keep &= cube['PdDistrict'].isin(filters.districts).to_numpy()
+    if filters.categories:
+        keep &= cube['Category'].isin(filters.categories).to_numpy()
+    if tuple(filters.hours) != (0, 23) and 'Hour' in cube.columns:
+        keep &= cube['Hour'].between(*filters.hours).to_numpy()
+    if filters.start or filters.end:
+        months = cube['Year'].to_numpy(dtype=np.int64) * 12 + cube['Month'].to_numpy(dtype=np.int64) - 1
+        if filters.start:
+            keep &= months >= filters.start.year * 12 + filters.start.month - 1
+        if filters.end:
+            keep &= months <= filters.end.year * 12 + filters.end.month - 1
+    return cube[keep].reset_index(drop=True)
+
+
+def filtered_cube(df, cube, index, filters):
+    """The cube for ``filters``, sliced from the full cube when possible, else rebuilt from the row mask."""
+    if not filters.active:
+        return cube
+    if filters.cube_compatible() and {'Year', 'Month', 'Hour'} <= set(cube.columns):
+        return filter_cube(cube, filters)
+    mask = index.mask(filters)
+    return cube if mask is None else build_cube(df, mask=mask)
@@ -0,0 +1,140 @@
+"""Chunked, incremental ingest of large incident CSVs."""
+import time
+
+import numpy as np
+import pandas as pd
+
+from sfcrime.aggregates import build_cube, merge_cubes
+from sfcrime.data import CSV_DTYPES, REQUIRED_COLUMNS, apply_schema, concat_frames, row_hashes
+from sfcrime.datetime_features import add_time_features
+
+CHUNK_ROWS = 250_000
+
+
+class ChunkedIngest:
+    """Parse a CSV a chunk at a time, growing the frame and aggregate cube as it goes.
+
+    Each chunk is parsed straight into the compact schema, deduplicated against
+    every row seen so far and folded into ``cube``. Callers can render the
+    partial ``cube`` between calls to ``read``; the chunks are only joined into
+    one frame by ``frame()``, which is meant to be called once at the end. With
+    ``keep_rows=False`` only the cube is kept and each chunk is left to the
+    caller of ``read_chunk``. ``known_hashes`` are sorted row hashes of data
+    stored elsewhere (they may be memory-mapped); rows matching them are
+    skipped as well.
+    """
+
+    def __init__(self, source, total_bytes=None, chunksize=CHUNK_ROWS, keep_rows=True, known_hashes=()):
+        self.source = source
+        self.total_bytes = total_bytes
+        self.keep_rows = keep_rows
+        self.known_hashes = list(known_hashes)
+        self.chunks = []
+        self.cube = None
+        self.rows = 0
+        self.rows_read = 0
+        self.done = False
+        self._reader = pd.read_csv(source, dtype=CSV_DTYPES, chunksize=chunksize)
+        # Sorted runs of row hashes, each less than half the size of the one before
+        self._seen = []
+        self._frame = None
+
+    @property
+    def hashes(self):
+        """Sorted hashes of the rows ingested so far."""
+        if len(self._seen) != 1:
+            self._seen = [np.sort(np.concatenate([np.empty(0, dtype=np.uint64), *self._seen]))]
+        return self._seen[0]
+
+    @property
+    def progress(self):
+        """Fraction of the source consumed, from its read position."""
+        if self.done:
+            return 1.0
+        if not self.total_bytes or not hasattr(self.source, 'tell'):
+            return 0.0
+        return min(self.source.tell() / self.total_bytes, 1.0)
+
+    def read_chunk(self):
+        """Ingest the next chunk; returns the new rows, or None once the source is exhausted."""
+        try:
+            chunk = next(self._reader)
+        except StopIteration:
+            self.done = True
+            self._reader.close()
+            return None
+
+        self.rows_read += len(chunk)
+        chunk = self._drop_seen(prepare_chunk(chunk))
+        if len(chunk):
+            self.rows += len(chunk)
+            if self.keep_rows:
+                self.chunks.append(chunk)
+                self._frame = None
+            partial = build_cube(chunk)
+            self.cube = partial if self.cube is None else merge_cubes([self.cube, partial])
+        return chunk
+
+    def read(self, time_budget=None):
+        """Ingest chunks until the source is exhausted or ``time_budget`` seconds have passed."""
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        while not self.done:
+            self.read_chunk()
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        return self
+
+    def frame(self):
+        """All rows ingested so far as a single frame, ordered by date like ``prepare_frame``.
+
+        Copies every row, so call it once the source is read rather than per chunk.
+        """
+        if not self.chunks:
+            return None
+        if self._frame is None:
+            self._frame = concat_frames(self.chunks)
+            if 'Dates' in self._frame.columns:
+                self._frame = self._frame.sort_values('Dates', kind='stable', ignore_index=True)
+            self.chunks = [self._frame]
+        return self._frame
+
+    def _drop_seen(self, chunk):
+        hashes = row_hashes(chunk)
+        fresh = ~pd.Series(hashes).duplicated().to_numpy()
+        for known in [*self._seen, *self.known_hashes]:
+            fresh &= ~sorted_contains(known, hashes)
+        self._seen.append(np.sort(hashes[fresh]))
+        # Merging runs of similar size keeps O(log n) runs to search and sorts
+        # each hash O(log n) times, instead of re-inserting into one array per chunk
+        while len(self._seen) > 1 and len(self._seen[-2]) <= 2 * len(self._seen[-1]):
+            last = self._seen.pop()
+            self._seen[-1] = np.sort(np.concatenate([self._seen[-1], last]))
+        return chunk[fresh].reset_index(drop=True)
+
+
+def sorted_contains(sorted_values, values):
+    """Mask of the ``values`` present in the ascending array ``sorted_values``."""
+    if not len(sorted_values):
+        return np.zeros(len(values), dtype=bool)
+    pos = np.searchsorted(sorted_values, values)
+    return sorted_values[np.minimum(pos, len(sorted_values) - 1)] == values
+
+
+def prepare_chunk(chunk):
+    """Derive time columns and apply the loading schema to one parsed chunk."""
+    if 'Date' in chunk.columns and 'Dates' not in chunk.columns:
+        chunk = chunk.rename(columns={'Date': 'Dates'})
+
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns in dataset: {', '.join(missing_columns)}")
+
+    if 'Dates' in chunk.columns:
+        chunk = add_time_features(chunk)
+    return apply_schema(chunk)
+
+
+def ingest_csv(source, chunksize=CHUNK_ROWS):
+    """Read a whole CSV through ``ChunkedIngest``, returning the frame and its cube."""
+    ingest = ChunkedIngest(source, chunksize=chunksize).read()
+    return ingest.frame(), ingest.cube
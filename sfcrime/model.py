@@ -0,0 +1,327 @@
+"""Crime category classifier with a disk cache of trained models.
+
+Train and score from the command line with
+``python -m sfcrime.model train.csv [--score new.csv]``.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.metrics import log_loss
+
+from sfcrime.data import CACHE_DIR, load_dataset, row_hashes
+from sfcrime.datetime_features import DAY_ORDER, MONTH_ORDER
+from sfcrime.spatial import SF_LAT_RANGE, SF_LON_RANGE, project, valid_coordinates
+
+MODEL_DIR = os.path.join(CACHE_DIR, "models")
+
+# Bump whenever the features or the saved attributes change so old models get retrained
+MODEL_VERSION = 1
+
+FEATURE_COLUMNS = ['Hour', 'DayOfWeek', 'Month', 'PdDistrict', 'X', 'Y']
+FEATURE_NAMES = ['Hour', 'DayOfWeek', 'Month', 'PdDistrict', 'GridX', 'GridY']
+
+# Categories outside the most frequent ones are predicted as a single class
+OTHER = 'OTHER'
+
+DEFAULT_PARAMS = {
+    'top_categories': 10,
+    'grid_meters': 500,
+    'iterations': 30,
+    'learning_rate': 0.2,
+    'max_leaf_nodes': 31,
+    'sample_rows': 200_000,
+}
+
+# Distinct feature rows scored per predict_proba call
+BATCH_ROWS = 100_000
+
+# Share of the training sample held out for the reported metrics
+HOLDOUT = 0.2
+
+
+def missing_features(df):
+    return [col for col in FEATURE_COLUMNS if col not in df.columns]
+
+
+def feature_codes(df, districts, grid_meters):
+    """Small non-negative integer code per feature and row, -1 where unknown.
+
+    Districts are coded by their position in ``districts``, and locations by
+    the ``grid_meters`` square cell they fall in, so the codes of a frame do
+    not depend on its own categories.
+    """
+    hours = df['Hour'].to_numpy(dtype=np.float64, na_value=np.nan)
+    days = recode(df['DayOfWeek'], DAY_ORDER)
+    months = df['Month']
+    if pd.api.types.is_numeric_dtype(months):
+        months = months.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        # Uploads without a Dates column may carry month names
+        months = recode(months, MONTH_ORDER) + 1.0
+    district_codes = recode(df['PdDistrict'], districts)
+
+    x = df['X'].to_numpy(dtype=np.float64, na_value=np.nan)
+    y = df['Y'].to_numpy(dtype=np.float64, na_value=np.nan)
+    east, north = project(x, y)
+    inside = valid_coordinates(x, y)
+
+    codes = np.full((len(df), len(FEATURE_NAMES)), -1, dtype=np.int16)
+    codes[:, 0] = np.where((hours >= 0) & (hours < 24), np.nan_to_num(hours), -1)
+    codes[:, 1] = days
+    codes[:, 2] = np.where((months >= 1) & (months <= 12), np.nan_to_num(months) - 1, -1)
+    codes[:, 3] = district_codes
+    codes[:, 4] = np.where(inside, east // grid_meters, -1)
+    codes[:, 5] = np.where(inside, north // grid_meters, -1)
+    return codes
+
+
+def recode(col, categories):
+    """Position of each value of ``col`` in ``categories``, -1 if absent."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        # Map the few categories rather than every row
+        positions = pd.Index(categories).get_indexer(col.cat.categories.astype(str))
+        codes = col.cat.codes.to_numpy()
+        return np.where(codes >= 0, positions[codes], -1)
+    return pd.Categorical(col.astype(str), categories=categories).codes
+
+
+def stratified_holdout(labels, share, rng):
+    """Boolean mask holding out about ``share`` of the rows of each label in ``labels``.
+
+    Every label keeps at least one row outside the holdout, so the classifier
+    has seen each label it is evaluated on.
+    """
+    order = np.lexsort((rng.random(len(labels)), labels))
+    ordered = labels[order]
+    counts = np.bincount(labels)[ordered]
+    # Position of each row among the rows of its label, in random order
+    rank = np.arange(len(labels)) - np.searchsorted(ordered, ordered)
+    holdout = np.zeros(len(labels), dtype=bool)
+    holdout[order] = rank < np.minimum(np.round(counts * share), counts - 1)
+    return holdout
+
+
+def feature_matrix(codes):
+    """Codes as the float matrix the classifier takes, with unknowns as NaN."""
+    features = codes.astype(np.float32)
+    features[codes < 0] = np.nan
+    return features
+
+
+def frame_key(df):
+    """Content hash of the training columns, for frames without a dataset key."""
+    columns = [col for col in FEATURE_COLUMNS + ['Category'] if col in df.columns]
+    return hashlib.sha256(row_hashes(df[columns]).tobytes()).hexdigest()
+
+
+class CategoryModel:
+    """Gradient-boosted classifier predicting an incident's category.
+
+    The features are the hour, weekday, month, district and the grid cell of
+    the location. Every feature is a small integer code, so a frame is scored
+    by predicting each distinct combination of codes once, in batches of
+    ``BATCH_ROWS``, and gathering the results back to the rows.
+    """
+
+    def __init__(self, params=None):
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        self.classes = []
+        self.districts = []
+        self.metrics = {}
+        self.classifier = None
+
+    @property
+    def feature_shape(self):
+        """Number of codes per feature, plus one for unknown."""
+        width, height = project(SF_LON_RANGE[1], SF_LAT_RANGE[1])
+        cells = [int(extent // self.params['grid_meters']) + 1 for extent in (width, height)]
+        return (25, len(DAY_ORDER) + 1, 13, len(self.districts) + 1, cells[0] + 1, cells[1] + 1)
+
+    def fit(self, df, seed=0):
+        """Train on a sample of ``df`` and record metrics on a held-out part of it."""
+        missing = missing_features(df) + ([] if 'Category' in df.columns else ['Category'])
+        if missing:
+            raise ValueError(f"Training requires the columns: {', '.join(missing)}")
+        params = self.params
+        rng = np.random.default_rng(seed)
+        labelled = np.flatnonzero(df['Category'].notna().to_numpy())
+        if len(labelled) > params['sample_rows']:
+            labelled = np.sort(rng.choice(labelled, params['sample_rows'], replace=False))
+        if len(labelled) < 10:
+            raise ValueError("Training requires at least 10 incidents with a category")
+        sample = df.iloc[labelled]
+
+        self.districts = sorted(sample['PdDistrict'].dropna().astype(str).unique())
+        counts = sample['Category'].astype(str).value_counts()
+        self.classes = list(counts.index[:params['top_categories']])
+        if len(counts) > len(self.classes):
+            self.classes.append(OTHER)
+        labels = self.class_codes(sample['Category'])
+
+        features = feature_matrix(feature_codes(sample, self.districts, params['grid_meters']))
+        holdout = stratified_holdout(labels, HOLDOUT, rng)
+        if not holdout.any():
+            raise ValueError("Training requires more incidents per category to hold some out for the metrics")
+        self.classifier = HistGradientBoostingClassifier(
+            max_iter=params['iterations'],
+            learning_rate=params['learning_rate'],
+            max_leaf_nodes=params['max_leaf_nodes'],
+            categorical_features=[1, 3],
+            early_stopping=False,
+            random_state=seed,
+        )
+        start = time.perf_counter()
+        self.classifier.fit(features[~holdout], labels[~holdout])
+        train_seconds = time.perf_counter() - start
+
+        probabilities = self.classifier.predict_proba(features[holdout])
+        actual = labels[holdout]
+        # Columns of predict_proba follow the classes seen in training
+        seen = self.classifier.classes_
+        ranked = seen[np.argsort(-probabilities, axis=1)]
+        self.metrics = {
+            'train_rows': int((~holdout).sum()),
+            'holdout_rows': int(holdout.sum()),
+            'accuracy': float((ranked[:, 0] == actual).mean()),
+            'top3_accuracy': float((ranked[:, :3] == actual[:, None]).any(axis=1).mean()),
+            'log_loss': float(log_loss(actual, probabilities, labels=seen)),
+            'baseline_accuracy': float((actual == np.bincount(labels[~holdout]).argmax()).mean()),
+            'train_seconds': train_seconds,
+        }
+        return self
+
+    def class_codes(self, categories):
+        """Position of each category among the classes; unlisted ones count as OTHER."""
+        codes = recode(categories, self.classes)
+        if OTHER in self.classes:
+            codes = np.where(codes < 0, self.classes.index(OTHER), codes)
+        return codes
+
+    def predict(self, df, batch_rows=BATCH_ROWS):
+        """Most likely category and its probability for every row of ``df``.
+
+        Returns a frame with a categorical ``Predicted`` column and a float32
+        ``Confidence`` column, aligned with ``df``.
+        """
+        missing = missing_features(df)
+        if missing:
+            raise ValueError(f"Scoring requires the columns: {', '.join(missing)}")
+        codes = feature_codes(df, self.districts, self.params['grid_meters'])
+        keys = np.ravel_multi_index((codes.astype(np.int64) + 1).T, self.feature_shape)
+        distinct, inverse = np.unique(keys, return_inverse=True)
+
+        predicted = np.empty(len(distinct), dtype=np.int16)
+        confidence = np.empty(len(distinct), dtype=np.float32)
+        for start in range(0, len(distinct), batch_rows):
+            batch = distinct[start:start + batch_rows]
+            batch_codes = np.stack(np.unravel_index(batch, self.feature_shape), axis=1) - 1
+            probabilities = self.classifier.predict_proba(feature_matrix(batch_codes))
+            best = probabilities.argmax(axis=1)
+            predicted[start:start + len(batch)] = self.classifier.classes_[best]
+            confidence[start:start + len(batch)] = probabilities[np.arange(len(batch)), best]
+
+        inverse = inverse.reshape(-1)
+        return pd.DataFrame({
+            'Predicted': pd.Categorical.from_codes(predicted[inverse], categories=self.classes),
+            'Confidence': confidence[inverse],
+        }, index=df.index)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(self, tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        return joblib.load(path)
+
+
+def prediction_summary(model, predictions, categories):
+    """Accuracy of ``predictions`` against the actual ``categories``, and both counts per class."""
+    actual = model.class_codes(categories)
+    predicted = predictions['Predicted'].cat.codes.to_numpy()
+    known = actual >= 0
+    accuracy = float((predicted[known] == actual[known]).mean()) if known.any() else float('nan')
+    counts = pd.DataFrame({
+        'Category': model.classes,
+        'Actual': np.bincount(actual[known], minlength=len(model.classes)),
+        'Predicted': np.bincount(predicted, minlength=len(model.classes)),
+    })
+    return accuracy, counts
+
+
+def model_path(dataset_key, params, model_dir=MODEL_DIR):
+    """Cache file for a model trained on ``dataset_key`` with ``params``."""
+    payload = json.dumps({
+        'dataset': dataset_key,
+        'params': {**DEFAULT_PARAMS, **params},
+        'model_version': MODEL_VERSION,
+        'sklearn': sklearn.__version__,
+    }, sort_keys=True)
+    return os.path.join(model_dir, f"category-{hashlib.sha256(payload.encode()).hexdigest()[:16]}.joblib")
+
+
+def cached_model(dataset_key, params, model_dir=MODEL_DIR):
+    """The cached model for ``dataset_key`` and ``params``, or None if none was trained."""
+    path = model_path(dataset_key, params, model_dir)
+    try:
+        return CategoryModel.load(path)
+    except (OSError, EOFError):
+        return None
+
+
+def train_or_load(df, params=None, dataset_key=None, model_dir=MODEL_DIR):
+    """Return the cached model for this data and ``params``, training and saving it if needed."""
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    if dataset_key is None:
+        dataset_key = frame_key(df)
+    model = cached_model(dataset_key, params, model_dir)
+    if model is None:
+        model = CategoryModel(params).fit(df)
+        model.save(model_path(dataset_key, params, model_dir))
+    return model
+
+
+def model_size(dataset_key, params, model_dir=MODEL_DIR):
+    """Bytes of the cached model file."""
+    return os.path.getsize(model_path(dataset_key, params, model_dir))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the category model and score incident CSVs.")
+    parser.add_argument('csv', help="labelled incidents to train on")
+    parser.add_argument('--score', help="CSV to score; predictions are written next to it")
+    for name, default in DEFAULT_PARAMS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default,
+                            help="(default: %(default)s)")
+    args = parser.parse_args(argv)
+    params = {name: getattr(args, name) for name in DEFAULT_PARAMS}
+
+    df = load_dataset(args.csv)
+    model = train_or_load(df, params)
+    for name, value in model.metrics.items():
+        print(f"{name:<18} {value:,.4f}" if isinstance(value, float) else f"{name:<18} {value:,}")
+
+    if args.score:
+        scored = load_dataset(args.score)
+        start = time.perf_counter()
+        predictions = model.predict(scored)
+        seconds = time.perf_counter() - start
+        output = f"{os.path.splitext(args.score)[0]}.predictions.csv"
+        predictions.to_csv(output, index=False)
+        print(f"Scored {len(scored):,} rows in {seconds:.2f}s ({len(scored) / seconds:,.0f} rows/s) to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
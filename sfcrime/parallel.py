@@ -0,0 +1,104 @@
+"""Partitioned, multi-threaded counting of categorical code combinations."""
+import concurrent.futures
+import os
+
+import numpy as np
+
+# Threads used for counting; NumPy releases the GIL inside bincount and sort,
+# so the partitions are counted in parallel without copying the codes
+WORKERS = int(os.environ.get("SFCRIME_WORKERS", os.cpu_count() or 1))
+
+# Most rows per partition
+PARTITION_ROWS = 1_000_000
+
+# Fewest rows per partition; smaller inputs, such as most cubes, are split
+# across the workers, and inputs up to this size are counted on the calling thread
+MIN_PARTITION_ROWS = 50_000
+
+
+def partition_bounds(rows, partition_rows=PARTITION_ROWS):
+    """``(start, stop)`` row ranges splitting ``rows`` into partitions of at most ``partition_rows``."""
+    starts = range(0, max(rows, 1), partition_rows)
+    return [(start, min(start + partition_rows, rows)) for start in starts]
+
+
+def default_partition_rows(rows, workers=WORKERS):
+    """Partition size giving each of ``workers`` threads a share of ``rows``, within the limits above."""
+    per_worker = -(-rows // max(workers, 1))
+    return min(PARTITION_ROWS, max(MIN_PARTITION_ROWS, per_worker))
+
+
+def count_combinations(codes, shape, mask=None, weights=None, workers=WORKERS, partition_rows=None):
+    """Count each observed combination of the integer ``codes``, one array per dimension.
+
+    Returns ``(cells, counts)``: ascending flat indexes into ``shape`` and their
+    counts, as ``np.unique(..., return_counts=True)`` would on the raveled codes.
+    Rows with a negative code, or outside the boolean ``mask``, are not counted.
+    With integer ``weights`` each row adds its weight instead of one, which
+    re-aggregates a cube over fewer dimensions.
+
+    The rows are split into partitions that a pool of ``workers`` threads count
+    independently, ``default_partition_rows`` at a time unless given. When the
+    table of all ``shape`` cells is small next to the input, each worker
+    accumulates a dense ``bincount``; otherwise partitions are reduced with
+    ``np.unique`` and the partial cells merged afterwards.
+    """
+    rows = len(codes[0])
+    size = int(np.prod(shape))
+    bounds = partition_bounds(rows, partition_rows or default_partition_rows(rows, workers))
+    workers = max(1, min(workers, len(bounds)))
+    # Dense tables for every worker together stay no larger than the raveled codes
+    dense = size * workers <= rows
+
+    def flat_codes(start, stop):
+        part = [c[start:stop] for c in codes]
+        part_weights = None if weights is None else weights[start:stop]
+        if mask is not None:
+            part = [c[mask[start:stop]] for c in part]
+            part_weights = None if weights is None else part_weights[mask[start:stop]]
+        valid = np.logical_and.reduce([c >= 0 for c in part])
+        flat = np.ravel_multi_index([c[valid] for c in part], shape)
+        return flat, None if weights is None else part_weights[valid]
+
+    def count_partition(start, stop):
+        flat, part_weights = flat_codes(start, stop)
+        if dense:
+            return np.bincount(flat, weights=part_weights, minlength=size).astype(np.int64)
+        if part_weights is None:
+            return np.unique(flat, return_counts=True)
+        cells, inverse = np.unique(flat, return_inverse=True)
+        return cells, np.bincount(inverse, weights=part_weights, minlength=len(cells)).astype(np.int64)
+
+    def count(worker_bounds):
+        if dense:
+            totals = np.zeros(size, dtype=np.int64)
+            for start, stop in worker_bounds:
+                totals += count_partition(start, stop)
+            return [totals]
+        return [count_partition(start, stop) for start, stop in worker_bounds]
+
+    # Worker ``i`` takes every ``workers``-th partition
+    assignments = [bounds[i::workers] for i in range(workers)]
+    if workers == 1:
+        partials = count(bounds)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            partials = [partial for result in pool.map(count, assignments) for partial in result]
+
+    if dense:
+        totals = partials[0]
+        for other in partials[1:]:
+            totals += other
+        cells = np.flatnonzero(totals)
+        return cells, totals[cells]
+
+    if len(partials) == 1:
+        cells, counts = partials[0]
+    else:
+        cells, inverse = np.unique(np.concatenate([cells for cells, _ in partials]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([counts for _, counts in partials])).astype(np.int64)
+    if weights is not None:
+        # Cells whose rows all weigh zero are left out, as the dense tables do
+        nonzero = counts > 0
+        cells, counts = cells[nonzero], counts[nonzero]
+    return cells, counts
@@ -0,0 +1,71 @@
+"""Opt-in timing of each stage of a dashboard rerun."""
+import contextlib
+import datetime
+import json
+import os
+import time
+
+import pandas as pd
+
+from sfcrime.render import payload_bytes, trace_points
+
+PROFILE_LOG = os.environ.get("SFCRIME_PROFILE_LOG", os.path.join("logs", "profile.jsonl"))
+
+
+class RunProfiler:
+    """Collects stage timings, row counts and chart payload sizes for one script run.
+
+    Stages are recorded per view (``"load"``, ``"categories"``, ...) through the
+    ``stage`` context manager; ``chart`` adds the serialized size of each figure.
+    When disabled, every method is a cheap no-op.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, view, name, rows=None):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(view, name, time.perf_counter() - start, rows=rows)
+
+    def chart(self, view, fig):
+        """Record the point count and serialized size of ``fig``."""
+        if not self.enabled:
+            return
+        start = time.perf_counter()
+        payload = payload_bytes(fig)
+        self._add(view, 'serialize', time.perf_counter() - start,
+                  rows=sum(trace_points(trace) for trace in fig.data), payload_bytes=payload)
+
+    def summary(self):
+        columns = ['view', 'stage', 'seconds', 'rows', 'payload_bytes']
+        return pd.DataFrame(self.records, columns=columns)
+
+    def total_seconds(self):
+        return time.perf_counter() - self._started
+
+    def export(self, path=PROFILE_LOG, **context):
+        """Append this run's records as one JSON line to ``path``."""
+        if not self.enabled:
+            return
+        entry = {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'total_seconds': self.total_seconds(),
+            **context,
+            'stages': self.records,
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+    def _add(self, view, name, seconds, rows=None, payload_bytes=None):
+        self.records.append({'view': view, 'stage': name, 'seconds': seconds,
+                             'rows': rows, 'payload_bytes': payload_bytes})
@@ -0,0 +1,125 @@
+"""Compact Plotly figures: WebGL traces, capped point counts and narrow typed arrays."""
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from sfcrime.timeseries import lttb
+
+# Scatter traces with more points than this are drawn with WebGL
+WEBGL_POINTS = 1000
+
+# Points kept per trace; lines are downsampled with LTTB and marker traces
+# keep their largest markers
+MAX_TRACE_POINTS = 10_000
+
+# Per-point trace attributes, including nested ones, that decimation must keep aligned
+POINT_ATTRIBUTES = ['x', 'y', 'lat', 'lon', 'text', 'hovertext', 'customdata', 'ids',
+                    'marker.size', 'marker.color', 'marker.symbol', 'marker.opacity']
+
+# Numeric arrays sent as typed arrays, which Plotly supports up to 32-bit integers
+NUMERIC_ATTRIBUTES = ['x', 'y', 'z', 'lat', 'lon', 'values', 'customdata', 'marker.size', 'marker.color']
+
+# Largest magnitude sent as float32, which keeps coordinates to about a metre
+# and counts to a few hundredths; larger values such as epoch times stay float64
+FLOAT32_LIMIT = 1e6
+
+
+def compact_figure(fig, max_points=MAX_TRACE_POINTS, webgl_points=WEBGL_POINTS):
+    """Rewrite ``fig`` for a smaller payload and faster drawing; returns it.
+
+    Traces over ``max_points`` are decimated, ``scatter`` traces over
+    ``webgl_points`` become ``scattergl``, date axes are sent as epoch
+    milliseconds and numeric arrays are narrowed to the smallest dtype
+    Plotly ships as a base64 typed array: int32 for whole numbers and
+    float32 for the rest.
+    """
+    traces = []
+    for trace in fig.data:
+        points = trace_points(trace)
+        if points > max_points:
+            _decimate(trace, points, max_points)
+            points = max_points
+        for name in NUMERIC_ATTRIBUTES:
+            values = _get(trace, name)
+            if values is not None:
+                narrowed = narrow_array(values)
+                if narrowed is not values:
+                    trace[name] = narrowed
+        _dates_to_milliseconds(fig, trace)
+        if trace.type == 'scatter' and points > webgl_points:
+            properties = trace.to_plotly_json()
+            properties.pop('type')
+            trace = go.Scattergl(properties, skip_invalid=True)
+        traces.append(trace)
+    fig.data = []
+    fig.add_traces(traces)
+    return fig
+
+
+def payload_bytes(fig):
+    """Size of the JSON that ``st.plotly_chart`` sends for ``fig``."""
+    return len(pio.to_json(fig, validate=False).encode())
+
+
+def trace_points(trace):
+    """Number of points in ``trace``, from its first per-point array."""
+    for name in ('x', 'lat', 'values', 'y'):
+        values = _get(trace, name)
+        if values is not None and np.ndim(values):
+            return len(values)
+    return 0
+
+
+def narrow_array(values):
+    """``values`` as int32 or float32 when that loses nothing visible, else unchanged."""
+    if not isinstance(values, np.ndarray) or values.dtype.kind not in 'iuf' or not values.size:
+        return values
+    if values.dtype.kind in 'iu':
+        if values.dtype.itemsize > 4 and np.abs(values).max() < 2 ** 31:
+            return values.astype(np.int32)
+        return values
+    if not np.isfinite(values).all():
+        return values
+    largest = np.abs(values).max()
+    if largest < 2 ** 31 and np.array_equal(values, np.round(values)):
+        return values.astype(np.int32)
+    if values.dtype.itemsize > 4 and largest < FLOAT32_LIMIT:
+        return values.astype(np.float32)
+    return values
+
+
+def _dates_to_milliseconds(fig, trace):
+    # Dates serialize as ISO strings, about three times the bytes of a float;
+    # date axes take epoch milliseconds as well
+    for axis in ('x', 'y'):
+        values = _get(trace, axis)
+        if isinstance(values, np.ndarray) and values.dtype.kind == 'M':
+            trace[axis] = values.astype('datetime64[ms]').astype(np.int64).astype(np.float64)
+            layout_axis = (_get(trace, f'{axis}axis') or axis).replace(axis, f'{axis}axis', 1)
+            fig.layout[layout_axis].type = 'date'
+
+
+def _decimate(trace, points, max_points):
+    x, y = _get(trace, 'x'), _get(trace, 'y')
+    size = _get(trace, 'marker.size')
+    if 'lines' in (trace['mode'] or '') and x is not None and y is not None:
+        x_numeric = np.asarray(x)
+        if x_numeric.dtype.kind == 'M':
+            x_numeric = x_numeric.astype('datetime64[ms]').astype(np.int64)
+        keep = lttb(x_numeric.astype(np.float64), np.asarray(y, dtype=np.float64), max_points)
+    elif isinstance(size, np.ndarray) and len(size) == points:
+        keep = np.sort(np.argsort(-size, kind='stable')[:max_points])
+    else:
+        keep = np.linspace(0, points - 1, max_points).astype(np.int64)
+
+    for name in POINT_ATTRIBUTES:
+        values = _get(trace, name)
+        if values is not None and not isinstance(values, str) and np.ndim(values) and len(values) == points:
+            trace[name] = np.asarray(values)[keep]
+
+
+def _get(trace, name):
+    try:
+        return trace[name]
+    except (KeyError, ValueError):
+        return None
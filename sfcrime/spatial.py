@@ -0,0 +1,217 @@
+"""Spatial aggregation and radius search over incident coordinates."""
+import collections
+
+import numpy as np
+import pandas as pd
+
+# Bounding box of San Francisco; the raw data marks unknown locations with Y=90
+SF_LON_RANGE = (-122.52, -122.35)
+SF_LAT_RANGE = (37.70, 37.84)
+
+# Grid cells per 256px map tile, so one cell is roughly 16px on screen at its zoom level
+CELLS_PER_TILE = 16
+MIN_ZOOM, MAX_ZOOM = 10, 15
+MAX_CELLS = 20000
+
+# Metres per degree at San Francisco's latitude; the flat projection they give
+# is off by well under 1% anywhere in the city
+METERS_PER_DEGREE_LON = 88_140
+METERS_PER_DEGREE_LAT = 110_990
+
+# Edge of the spatial index's grid cells in metres
+INDEX_CELL_METERS = 100
+
+# Columns returned for the incidents around a location
+NEARBY_COLUMNS = ['Dates', 'Category', 'Descript', 'Address', 'X', 'Y']
+
+# Result of a radius search: the match count, the categories among the matches
+# and the closest incidents, nearest first
+Nearby = collections.namedtuple('Nearby', ['total', 'categories', 'incidents'])
+
+
+def valid_coordinates(x, y):
+    """Mask of points that fall inside San Francisco."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    return ((x >= SF_LON_RANGE[0]) & (x <= SF_LON_RANGE[1])
+            & (y >= SF_LAT_RANGE[0]) & (y <= SF_LAT_RANGE[1]))
+
+
+def zoom_cell_size(zoom):
+    """Grid cell edge in degrees for a web-map zoom level."""
+    zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def bin_points(x, y, categories, cell_size, max_cells=MAX_CELLS):
+    """Aggregate points into square grid cells of ``cell_size`` degrees.
+
+    ``categories`` is a categorical Series aligned with ``x``/``y``. Each row of
+    the result is one occupied cell with the centroid of its points, the
+    incident count and the most frequent category. Only the ``max_cells``
+    busiest cells are kept, so the output size does not grow with the input.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    codes = np.asarray(categories.cat.codes)
+
+    keep = valid_coordinates(x, y) & (codes >= 0)
+    x, y, codes = x[keep], y[keep], codes[keep]
+
+    n_cols = int(np.ceil((SF_LON_RANGE[1] - SF_LON_RANGE[0]) / cell_size)) + 1
+    col = ((x - SF_LON_RANGE[0]) // cell_size).astype(np.int64)
+    row = ((y - SF_LAT_RANGE[0]) // cell_size).astype(np.int64)
+    cells, inverse, counts = np.unique(row * n_cols + col, return_inverse=True, return_counts=True)
+
+    # Centroids from coordinate sums per cell
+    lon = np.bincount(inverse, weights=x, minlength=len(cells)) / counts
+    lat = np.bincount(inverse, weights=y, minlength=len(cells)) / counts
+
+    # Dominant category per cell from a cells x categories count matrix
+    n_categories = len(categories.cat.categories)
+    by_category = np.bincount(inverse * n_categories + codes,
+                              minlength=len(cells) * n_categories).reshape(len(cells), n_categories)
+    top = by_category.argmax(axis=1)
+
+    binned = pd.DataFrame({
+        'X': lon,
+        'Y': lat,
+        'Count': counts,
+        'Category': pd.Categorical.from_codes(top, dtype=categories.dtype),
+        'CategoryShare': by_category[np.arange(len(cells)), top] / counts,
+    })
+    if len(binned) > max_cells:
+        binned = binned.nlargest(max_cells, 'Count')
+    return binned.reset_index(drop=True)
+
+
+def bin_by_zoom(df, zoom, max_cells=MAX_CELLS, mask=None):
+    x, y, categories = df['X'].to_numpy(), df['Y'].to_numpy(), df['Category'].astype('category')
+    if mask is not None:
+        x, y, categories = x[mask], y[mask], categories[mask]
+    return bin_points(x, y, categories, zoom_cell_size(zoom), max_cells)
+
+
+def project(x, y):
+    """Longitude/latitude to metres east and north of the south-west corner of the city."""
+    east = (np.asarray(x, dtype=np.float64) - SF_LON_RANGE[0]) * METERS_PER_DEGREE_LON
+    north = (np.asarray(y, dtype=np.float64) - SF_LAT_RANGE[0]) * METERS_PER_DEGREE_LAT
+    return east, north
+
+
+class SpatialIndex:
+    """Grid index over incident coordinates for radius and nearest-incident queries.
+
+    Points inside San Francisco are projected to metres and sorted by the
+    ``INDEX_CELL_METERS`` square cell they fall in, with ``offsets`` marking
+    where each cell's points start. Cells along a grid row are adjacent in
+    that order, so a query reads one contiguous slice per grid row overlapping
+    its search circle and measures distances only to those points.
+    """
+
+    def __init__(self, x, y, addresses=None, cell_meters=INDEX_CELL_METERS):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        rows = np.flatnonzero(valid_coordinates(x, y))
+        east, north = project(x[rows], y[rows])
+
+        self.cell_meters = cell_meters
+        width, height = project(SF_LON_RANGE[1], SF_LAT_RANGE[1])
+        self.n_cols = int(width // cell_meters) + 1
+        self.n_rows = int(height // cell_meters) + 1
+        cells = (north // cell_meters).astype(np.int64) * self.n_cols + (east // cell_meters).astype(np.int64)
+        order = np.argsort(cells, kind='stable')
+
+        # Frame row of each indexed point, and its position in metres, in cell order
+        self.rows = rows[order].astype(np.int64)
+        self.east = east[order].astype(np.float32)
+        self.north = north[order].astype(np.float32)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=self.n_rows * self.n_cols))])
+
+        # Mean location of every address, for looking places up by name
+        self.addresses = None
+        if addresses is not None:
+            codes, self.addresses = np.asarray(addresses.cat.codes)[rows], addresses.cat.categories
+            known = codes >= 0
+            counts = np.bincount(codes[known], minlength=len(self.addresses))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self.address_x = np.bincount(codes[known], weights=x[rows][known], minlength=len(counts)) / counts
+                self.address_y = np.bincount(codes[known], weights=y[rows][known], minlength=len(counts)) / counts
+
+    @classmethod
+    def from_frame(cls, df):
+        addresses = df['Address'].astype('category') if 'Address' in df.columns else None
+        return cls(df['X'].to_numpy(), df['Y'].to_numpy(), addresses)
+
+    def within(self, lon, lat, radius):
+        """Frame rows within ``radius`` metres of a point and their distances, nearest first."""
+        east, north = project(lon, lat)
+        positions = self._candidates(float(east), float(north), radius)
+        distances = np.hypot(self.east[positions] - east, self.north[positions] - north)
+        inside = distances <= radius
+        positions, distances = positions[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return self.rows[positions[order]], distances[order]
+
+    def nearest(self, lon, lat, k=10):
+        """The ``k`` frame rows closest to a point and their distances, nearest first."""
+        radius = self.cell_meters
+        limit = np.hypot(self.n_cols, self.n_rows) * self.cell_meters
+        # Widen the search until it holds k points or covers the whole grid
+        while True:
+            rows, distances = self.within(lon, lat, radius)
+            if len(rows) >= k or radius >= limit:
+                return rows[:k], distances[:k]
+            radius *= 2
+
+    def locate(self, address):
+        """Mean ``(lon, lat)`` of the incidents at ``address``, or None if it is unknown."""
+        if self.addresses is None or address not in self.addresses:
+            return None
+        code = self.addresses.get_loc(address)
+        if np.isnan(self.address_x[code]):
+            return None
+        return float(self.address_x[code]), float(self.address_y[code])
+
+    def search_addresses(self, text, limit=20):
+        """Known addresses containing ``text``, ignoring case."""
+        if self.addresses is None or not text:
+            return []
+        matches = self.addresses[self.addresses.str.contains(text, case=False, regex=False)]
+        return matches[:limit].tolist()
+
+    def _candidates(self, east, north, radius):
+        """Index positions of the points in cells overlapping the square around a circle."""
+        col_lo = max(int((east - radius) // self.cell_meters), 0)
+        col_hi = min(int((east + radius) // self.cell_meters), self.n_cols - 1)
+        row_lo = max(int((north - radius) // self.cell_meters), 0)
+        row_hi = min(int((north + radius) // self.cell_meters), self.n_rows - 1)
+        if col_lo > col_hi or row_lo > row_hi:
+            return np.empty(0, dtype=np.int64)
+        starts = self.offsets[np.arange(row_lo, row_hi + 1) * self.n_cols + col_lo]
+        stops = self.offsets[np.arange(row_lo, row_hi + 1) * self.n_cols + col_hi + 1]
+        return np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)])
+
+
+def parse_point(text):
+    """``(lon, lat)`` from text such as ``"37.7749, -122.4194"``, or None if it is not a point in the city."""
+    parts = text.replace(',', ' ').split()
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if not valid_coordinates(lon, lat):
+        # Accept the longitude first as well
+        lon, lat = lat, lon
+    return (lon, lat) if valid_coordinates(lon, lat) else None
+
+
+def nearby_result(df, rows, distances, limit):
+    """``Nearby`` for the frame ``rows`` matched by a radius search."""
+    categories = df['Category'].iloc[rows].value_counts()
+    categories = categories[categories > 0].rename_axis('Category').reset_index(name='Count')
+    incidents = df.iloc[rows[:limit]][[col for col in NEARBY_COLUMNS if col in df.columns]]
+    incidents = incidents.assign(Distance=distances[:limit]).reset_index(drop=True)
+    return Nearby(len(rows), categories, incidents)
@@ -0,0 +1,150 @@
+"""Append-only columnar incident store, refreshed one CSV batch at a time.
+
+Append a daily feed with ``python -m sfcrime.store new_incidents.csv``; the
+app loads the store instead of the demo data once it holds any rows.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+
+import numpy as np
+
+from sfcrime.aggregates import merge_cubes
+from sfcrime.data import CACHE_DIR, CACHE_VERSION, concat_frames, read_columnar, write_columnar
+from sfcrime.ingest import CHUNK_ROWS, ChunkedIngest
+
+STORE_DIR = os.environ.get("SFCRIME_STORE_DIR", os.path.join(CACHE_DIR, "store"))
+
+
+class IncidentStore:
+    """Columnar incident dataset that grows by appending CSV batches.
+
+    Every batch becomes its own uncompressed Arrow part, stored with the
+    sorted hashes of its rows. A new batch is deduplicated by binary search in
+    the memory-mapped hashes of the earlier parts, and its cube is merged into
+    the stored one, so an append reads and writes the new rows and the cube
+    but never the earlier rows. ``manifest.json`` lists the committed parts and
+    is replaced last, so readers never see a half-written batch.
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.manifest = self._read_manifest()
+
+    @property
+    def rows(self):
+        return self.manifest['rows']
+
+    @property
+    def batches(self):
+        return len(self.manifest['parts'])
+
+    @property
+    def key(self):
+        """Identifies the committed contents, for use in cache keys."""
+        return f"{self.batches}:{self.rows}"
+
+    def frame(self):
+        """All stored rows; a single part is memory-mapped rather than copied."""
+        if not self.batches:
+            return None
+        return concat_frames([read_columnar(self._path(part['name'], 'arrow')) for part in self.manifest['parts']])
+
+    def cube(self):
+        if not self.batches:
+            return None
+        return read_columnar(os.path.join(self.root, self.manifest['cube']))
+
+    def append(self, source, chunksize=CHUNK_ROWS):
+        """Add the rows of the CSV ``source`` that are not stored yet.
+
+        Returns ``(rows_added, rows_read)``. Only one append may run at a time;
+        a second one raises ``RuntimeError`` while the lock file exists.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        lock_path = os.path.join(self.root, 'append.lock')
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            raise RuntimeError(f"Another append is in progress (remove {lock_path} if it was interrupted)")
+        try:
+            return self._append(source, chunksize)
+        finally:
+            os.remove(lock_path)
+
+    def _append(self, source, chunksize):
+        manifest = self.manifest = self._read_manifest()
+        known = [np.load(self._path(part['name'], 'hashes.npy'), mmap_mode='r') for part in manifest['parts']]
+        ingest = ChunkedIngest(source, chunksize=chunksize, known_hashes=known).read()
+        batch = ingest.frame()
+        if batch is None:
+            return 0, ingest.rows_read
+
+        name = f"part-{len(manifest['parts']):05d}"
+        _atomic_write(self._path(name, 'arrow'),
+                      lambda f: write_columnar(batch, f))
+        _atomic_write(self._path(name, 'hashes.npy'), lambda f: np.save(f, ingest.hashes))
+
+        # The cube is updated by the batch's delta instead of being rebuilt
+        cube = ingest.cube if not manifest['parts'] else merge_cubes([self.cube(), ingest.cube])
+        cube_name = f"cube-{len(manifest['parts']):05d}.arrow"
+        _atomic_write(os.path.join(self.root, cube_name),
+                      lambda f: write_columnar(cube, f))
+
+        previous_cube = manifest['cube']
+        manifest = {
+            'version': CACHE_VERSION,
+            'rows': manifest['rows'] + len(batch),
+            'cube': cube_name,
+            'parts': manifest['parts'] + [{
+                'name': name,
+                'rows': len(batch),
+                'appended': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }],
+        }
+        _atomic_write(os.path.join(self.root, 'manifest.json'), lambda f: f.write(json.dumps(manifest).encode()))
+        self.manifest = manifest
+        if previous_cube:
+            os.remove(os.path.join(self.root, previous_cube))
+        return len(batch), ingest.rows_read
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.root, 'manifest.json')) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {'version': CACHE_VERSION, 'rows': 0, 'cube': None, 'parts': []}
+        if manifest['version'] != CACHE_VERSION:
+            raise ValueError(f"The store in {self.root} was written with an older column layout; "
+                             "move it aside and append its source files again")
+        return manifest
+
+    def _path(self, name, suffix):
+        return os.path.join(self.root, f"{name}.{suffix}")
+
+
+def _atomic_write(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append incident CSVs to the columnar store.")
+    parser.add_argument('csv', nargs='+', help="CSV batches to append, in order")
+    parser.add_argument('--root', default=STORE_DIR, help="store directory (default: %(default)s)")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS, help="rows parsed per chunk (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    store = IncidentStore(args.root)
+    for path in args.csv:
+        added, read = store.append(path, args.chunksize)
+        print(f"{path}: added {added:,} of {read:,} rows; the store now holds {store.rows:,}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
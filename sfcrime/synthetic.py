@@ -0,0 +1,86 @@
+"""Synthetic incidents shaped like the Kaggle SF crime training data."""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from sfcrime.datetime_features import DATE_FORMAT, DAY_ORDER
+
+CATEGORIES = [
+    'ARSON', 'ASSAULT', 'BAD CHECKS', 'BRIBERY', 'BURGLARY', 'DISORDERLY CONDUCT',
+    'DRIVING UNDER THE INFLUENCE', 'DRUG/NARCOTIC', 'DRUNKENNESS', 'EMBEZZLEMENT', 'EXTORTION',
+    'FAMILY OFFENSES', 'FORGERY/COUNTERFEITING', 'FRAUD', 'GAMBLING', 'KIDNAPPING', 'LARCENY/THEFT',
+    'LIQUOR LAWS', 'LOITERING', 'MISSING PERSON', 'NON-CRIMINAL', 'OTHER OFFENSES',
+    'PORNOGRAPHY/OBSCENE MAT', 'PROSTITUTION', 'RECOVERED VEHICLE', 'ROBBERY', 'RUNAWAY',
+    'SECONDARY CODES', 'SEX OFFENSES FORCIBLE', 'SEX OFFENSES NON FORCIBLE', 'STOLEN PROPERTY',
+    'SUICIDE', 'SUSPICIOUS OCC', 'TREA', 'TRESPASS', 'VANDALISM', 'VEHICLE THEFT', 'WARRANTS',
+    'WEAPON LAWS',
+]
+DISTRICTS = ['BAYVIEW', 'CENTRAL', 'INGLESIDE', 'MISSION', 'NORTHERN',
+             'PARK', 'RICHMOND', 'SOUTHERN', 'TARAVAL', 'TENDERLOIN']
+RESOLUTIONS = ['NONE', 'ARREST, BOOKED', 'ARREST, CITED', 'LOCATED', 'PSYCHOPATHIC CASE',
+               'UNFOUNDED', 'JUVENILE BOOKED', 'NOT PROSECUTED', 'EXCEPTIONAL CLEARANCE']
+STREETS = ['MARKET ST', 'MISSION ST', 'BRYANT ST', 'FOLSOM ST', 'TURK ST', 'ELLIS ST',
+           'GEARY BL', 'POWELL ST', 'VALENCIA ST', 'POLK ST', '3RD ST', '16TH ST']
+
+# Descriptions per category, giving roughly the ~900 distinct values of the real data
+DESCRIPTIONS_PER_CATEGORY = 23
+ADDRESS_COUNT = 20000
+DISTRICT_CENTERS = np.array([
+    (-122.393, 37.730), (-122.410, 37.798), (-122.440, 37.724), (-122.419, 37.760),
+    (-122.428, 37.789), (-122.446, 37.767), (-122.480, 37.780), (-122.400, 37.778),
+    (-122.480, 37.740), (-122.414, 37.784),
+])
+FIRST_DATE = np.datetime64('2003-01-06T00:00:00')
+LAST_DATE = np.datetime64('2015-05-13T23:59:59')
+
+
+def synthetic_incidents(rows, seed=0):
+    """Raw incident rows with the Kaggle columns, as the CSV loaders would see them.
+
+    Category frequencies are skewed like the real data, coordinates cluster
+    around each district, and about one row in ten thousand carries the
+    ``Y=90`` placeholder location.
+    """
+    rng = np.random.default_rng(seed)
+
+    category_weights = rng.zipf(1.6, len(CATEGORIES)).astype(float)
+    category = rng.choice(len(CATEGORIES), rows, p=category_weights / category_weights.sum())
+    district = rng.integers(0, len(DISTRICTS), rows)
+
+    span = (LAST_DATE - FIRST_DATE).astype('timedelta64[s]').astype(np.int64)
+    dates = FIRST_DATE + rng.integers(0, span, rows).astype('timedelta64[s]')
+    dates = np.sort(dates)[::-1]
+
+    x = DISTRICT_CENTERS[district, 0] + rng.normal(0, 0.012, rows)
+    y = DISTRICT_CENTERS[district, 1] + rng.normal(0, 0.009, rows)
+    invalid = rng.random(rows) < 1e-4
+    x[invalid], y[invalid] = -120.5, 90.0
+
+    descriptions = [f"{category_name} {i + 1}" for category_name in CATEGORIES
+                    for i in range(DESCRIPTIONS_PER_CATEGORY)]
+    description = category * DESCRIPTIONS_PER_CATEGORY + rng.integers(0, DESCRIPTIONS_PER_CATEGORY, rows)
+    addresses = [f"{(i // len(STREETS)) * 100} Block of {STREETS[i % len(STREETS)]}"
+                 for i in range(ADDRESS_COUNT)]
+    weekday = ((dates.astype('datetime64[D]').view('i8') + 3) % 7)
+
+    return pd.DataFrame({
+        'Dates': pc.strftime(pa.array(dates), format=DATE_FORMAT).to_numpy(zero_copy_only=False),
+        'Category': pd.Categorical.from_codes(category, CATEGORIES),
+        'Descript': pd.Categorical.from_codes(description, descriptions),
+        'DayOfWeek': pd.Categorical.from_codes(weekday, DAY_ORDER),
+        'PdDistrict': pd.Categorical.from_codes(district, DISTRICTS),
+        'Resolution': pd.Categorical.from_codes(rng.integers(0, len(RESOLUTIONS), rows), RESOLUTIONS),
+        'Address': pd.Categorical.from_codes(rng.integers(0, ADDRESS_COUNT, rows), addresses),
+        'X': x,
+        'Y': y,
+    })
+
+
+def write_synthetic_csv(path, rows, seed=0, chunk_rows=1_000_000):
+    """Write ``rows`` synthetic incidents to ``path`` without holding them all as strings at once."""
+    df = synthetic_incidents(rows, seed)
+    for start in range(0, rows, chunk_rows):
+        df.iloc[start:start + chunk_rows].to_csv(path, mode='w' if start == 0 else 'a',
+                                                 header=start == 0, index=False)
+    return path
@@ -0,0 +1,154 @@
+"""Daily incident series with cumulative counts for range, resampling and rolling queries."""
+import numpy as np
+import pandas as pd
+
+from sfcrime.aggregates import dimension_codes
+from sfcrime.parallel import count_combinations
+
+FREQUENCIES = {'Daily': 'D', 'Weekly': 'W', 'Monthly': 'M'}
+
+# Points per trace handed to Plotly once a series is downsampled
+MAX_POINTS = 1000
+
+
+class DailySeries:
+    """Incidents per calendar day and group, stored as cumulative counts.
+
+    Row ``i`` of ``cumulative`` holds each group's incidents on the days before
+    ``days[i]``. The count over any date range is the difference of two rows
+    located by binary search, and resampling to weeks or months takes one such
+    difference per period, so no query rescans the incidents.
+    """
+
+    def __init__(self, first_day, labels, daily):
+        self.days = np.datetime64(first_day, 'D') + np.arange(len(daily))
+        self.labels = list(labels)
+        self.cumulative = np.zeros((len(daily) + 1, len(self.labels)), dtype=np.int64)
+        np.cumsum(daily, axis=0, out=self.cumulative[1:])
+
+    @classmethod
+    def from_codes(cls, days, codes, labels, weights=None):
+        """Build from a ``datetime64[D]`` day and a group code per row (or per counted cell with ``weights``)."""
+        if not len(days):
+            return cls(np.datetime64(0, 'D'), labels, np.zeros((0, len(labels)), dtype=np.int64))
+        first = days.min()
+        offsets = (days - first).astype(np.int64)
+        shape = (int(offsets.max()) + 1, len(labels))
+        cells, counts = count_combinations([offsets, codes], shape, weights=weights)
+        daily = np.zeros(shape, dtype=np.int64)
+        daily.flat[cells] = counts
+        return cls(first, labels, daily)
+
+    @classmethod
+    def from_frame(cls, df, group_by=None, mask=None):
+        """Daily counts of ``df`` split by the ``group_by`` column, or one 'All' series."""
+        days = df['Dates'].to_numpy(dtype='datetime64[D]')
+        if group_by is None:
+            codes, labels = np.zeros(len(days), dtype=np.int8), ['All']
+        else:
+            codes, labels = dimension_codes(df[group_by])
+        if mask is not None:
+            days, codes = days[mask], codes[mask]
+        return cls.from_codes(days, codes, labels)
+
+    def totals(self, start=None, end=None):
+        """Incidents per group from ``start`` through ``end`` (inclusive dates)."""
+        lo, hi = self._positions(start, end)
+        return self.cumulative[hi] - self.cumulative[lo]
+
+    def resample(self, freq='D', start=None, end=None):
+        """Counts per period ('D', 'W' or 'M') between two dates, indexed by period start.
+
+        Weeks start on Monday; the first and last periods are cut at ``start``
+        and ``end``.
+        """
+        lo, hi = self._positions(start, end)
+        if hi <= lo:
+            return pd.DataFrame(columns=self.labels, dtype=np.int64)
+        starts = period_starts(self.days[lo], self.days[hi - 1], freq)
+        edges = np.concatenate([[lo], np.searchsorted(self.days, starts[1:]), [hi]])
+        counts = np.diff(self.cumulative[edges], axis=0)
+        return pd.DataFrame(counts, index=pd.DatetimeIndex(starts.astype('datetime64[ns]')), columns=self.labels)
+
+    def _positions(self, start, end):
+        lo = 0 if start is None else np.searchsorted(self.days, np.datetime64(start, 'D'))
+        hi = len(self.days) if end is None else np.searchsorted(self.days, np.datetime64(end, 'D'), side='right')
+        return lo, max(lo, hi)
+
+
+def period_starts(first, last, freq):
+    """Start day of every period overlapping ``first`` through ``last``."""
+    if freq == 'W':
+        # 1970-01-01 was a Thursday; step back to the Monday of the first week
+        monday = first - (first.astype(np.int64) + 3) % 7
+        return np.arange(monday, last + 1, 7)
+    if freq == 'M':
+        return np.arange(first.astype('datetime64[M]'), last.astype('datetime64[M]') + 1).astype('datetime64[D]')
+    return np.arange(first, last + 1)
+
+
+def rolling_mean(counts, window):
+    """Trailing mean over ``window`` periods along the first axis, NaN until a window fills."""
+    counts = np.asarray(counts, dtype=np.float64)
+    means = np.full(counts.shape, np.nan)
+    if window <= len(counts):
+        cumulative = np.concatenate([np.zeros((1,) + counts.shape[1:]), np.cumsum(counts, axis=0)])
+        means[window - 1:] = (cumulative[window:] - cumulative[:-window]) / window
+    return means
+
+
+def lttb(x, y, threshold=MAX_POINTS):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    The first and last points are always kept; the rest are split into
+    ``threshold - 2`` buckets, and from each the point forming the largest
+    triangle with the previous pick and the next bucket's average is kept, so
+    peaks and dips survive the reduction.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x, next_y = x[hi:edges[bucket + 2]].mean(), y[hi:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous])
+                       - (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + int(np.argmax(areas))
+        keep[bucket + 1] = previous
+    return keep
+
+
+def trend_series(series, freq, window=1, start=None, end=None, top_n=None, max_points=MAX_POINTS):
+    """Downsampled ``(label, dates, values)`` per group for the trend chart.
+
+    Counts are resampled to ``freq`` between ``start`` and ``end``, smoothed
+    with a ``window``-period rolling mean, limited to the ``top_n`` groups with
+    the most incidents in the range and reduced to ``max_points`` each.
+    """
+    counts = series.resample(freq, start, end)
+    totals = series.totals(start, end)
+    order = [i for i in np.argsort(-totals, kind='stable') if totals[i] > 0][:top_n]
+
+    values = counts.to_numpy()
+    if window > 1:
+        values = rolling_mean(values, window)
+    dates = counts.index.to_numpy()
+
+    traces = []
+    for i in order:
+        y = values[:, i].astype(np.float64)
+        valid = ~np.isnan(y)
+        x, y = dates[valid], y[valid]
+        kept = lttb(x.view(np.int64), y, max_points)
+        traces.append((series.labels[i], x[kept], y[kept]))
+    return traces
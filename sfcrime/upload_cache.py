@@ -0,0 +1,113 @@
+"""Content-addressed cache of ingested uploads, bounded in memory and persisted to disk."""
+import collections
+import hashlib
+import os
+import threading
+
+from sfcrime.data import CACHE_DIR, CACHE_VERSION, read_columnar, write_columnar
+
+UPLOAD_CACHE_DIR = os.path.join(CACHE_DIR, "uploads")
+MEMORY_LIMIT_BYTES = int(os.environ.get("SFCRIME_UPLOAD_CACHE_MB", 2048)) * 1024 ** 2
+DISK_LIMIT_BYTES = int(os.environ.get("SFCRIME_UPLOAD_DISK_MB", 10240)) * 1024 ** 2
+
+
+def content_hash(source):
+    """sha256 of a file-like object's contents; leaves the read position at the start."""
+    digest = hashlib.sha256()
+    source.seek(0)
+    for block in iter(lambda: source.read(1 << 20), b""):
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def _frame_bytes(df):
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+class UploadCache:
+    """LRU cache of ``(frame, cube)`` pairs keyed by upload content hash.
+
+    Entries are evicted least-recently-used first once their combined size
+    passes ``max_bytes``. Every entry is also written to ``directory`` as Arrow
+    files, so a re-upload after eviction or a restart is memory-mapped instead
+    of parsed again; the directory is trimmed to ``max_disk_bytes`` by access
+    time. One instance is meant to be shared by all sessions of a process.
+    """
+
+    def __init__(self, directory=UPLOAD_CACHE_DIR, max_bytes=MEMORY_LIMIT_BYTES,
+                 max_disk_bytes=DISK_LIMIT_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached ``(frame, cube)`` for ``key``, or None."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                frame, cube, _ = self._entries[key]
+                return frame, cube
+
+        frame_path, cube_path = self._path(key, 'frame'), self._path(key, 'cube')
+        try:
+            frame, cube = read_columnar(frame_path), read_columnar(cube_path)
+        except (OSError, ValueError):
+            return None
+        for path in (frame_path, cube_path):
+            os.utime(path)
+        self._remember(key, frame, cube)
+        return frame, cube
+
+    def put(self, key, frame, cube):
+        """Store ``(frame, cube)`` and return them memory-mapped from their Arrow files.
+
+        Callers should keep the returned frames and drop the ones passed in,
+        so the parsed rows live only in the shared file cache.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        for kind, data in (('frame', frame), ('cube', cube)):
+            path = self._path(key, kind)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            write_columnar(data, tmp_path)
+            os.replace(tmp_path, path)
+            paths.append(path)
+        frame, cube = read_columnar(paths[0]), read_columnar(paths[1])
+        self._remember(key, frame, cube)
+        self._trim_disk()
+        return frame, cube
+
+    def _remember(self, key, frame, cube):
+        nbytes = _frame_bytes(frame) + _frame_bytes(cube)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (frame, cube, nbytes)
+            self._bytes += nbytes
+            # Always keep the newest entry, even when it alone is over the limit
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.arrow'):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+    def _path(self, key, kind):
+        return os.path.join(self.directory, f"{key}.v{CACHE_VERSION}.{kind}.arrow")
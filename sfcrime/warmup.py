@@ -0,0 +1,118 @@
+"""Warm the dashboard's caches so the first visitor is not the one who pays for them.
+
+``python -m sfcrime.warmup`` builds the on-disk caches (the columnar copy of
+the demo CSV) and times every warm-up step. ``python -m sfcrime.warmup --serve``
+starts the app and warms its in-memory caches in a background thread while
+the server comes up; options after ``--`` are passed to ``streamlit run``.
+"""
+import argparse
+import sys
+import threading
+import time
+
+from streamlit import runtime
+
+from sfcrime.backend import PARQUET_DIR, parquet_signature
+from sfcrime.charts import PALETTES
+from sfcrime.data import DEMO_CSV, file_fingerprint
+from sfcrime.filters import Filters
+from sfcrime.store import IncidentStore
+
+APP_SCRIPT = "streamlit_app.py"
+
+# The chart each view opens with, as ``(view, builder, params)``; the params
+# must match the app's widget defaults for the first render to hit the cache
+DEFAULT_CHARTS = [
+    ('categories', 'category_chart', (15, 'Bar Chart', PALETTES[0])),
+    ('districts', 'district_chart', ('Pie Chart', PALETTES[0], False)),
+    ('time', 'time_chart', ('Hour of Day', '#483D8B', '#9370DB', 8, 2)),
+    ('insights', 'category_district_chart', (5, 'Heatmap')),
+]
+
+
+def warm_up(log=print):
+    """Load the dataset the app opens with, its aggregates and each view's first chart.
+
+    Follows the app's choice of data (Parquet directory, then the store, then
+    the demo CSV) and its cache keys, so that a later session finds every step
+    cached. Returns ``[(step, seconds)]``.
+    """
+    # Imported here so the cached functions are declared once the runtime exists
+    from sfcrime.app_cache import (cached_chart, chart_key, load_cube, load_demo_data, load_filtered_cube,
+                                   load_frame_backend, load_parquet_backend, load_store_data)
+    timings = []
+
+    def step(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((name, time.perf_counter() - start))
+        log(f"{name:<28} {timings[-1][1]:8.3f}s")
+        return result
+
+    try:
+        store = IncidentStore()
+    except ValueError:
+        store = None
+
+    if PARQUET_DIR:
+        signature = parquet_signature(PARQUET_DIR)
+        dataset_key = f"parquet:{signature}"
+        backend = step('open_parquet', lambda: load_parquet_backend(PARQUET_DIR, signature))
+        cube = step('build_cube', lambda: load_filtered_cube(backend, dataset_key, Filters()))
+    else:
+        if store is not None and store.rows:
+            dataset_key = f"store:{store.key}"
+            df, cube = step('load_store', lambda: load_store_data(store.root, store.key))
+        else:
+            dataset_key = f"demo:{file_fingerprint(DEMO_CSV)}"
+            df = step('load_demo_data', load_demo_data)
+            if df is None:
+                raise RuntimeError(f"Could not load {DEMO_CSV}")
+            cube = step('build_cube', lambda: load_cube(df, dataset_key))
+        step('bitmap_index', lambda: load_frame_backend(df, cube, dataset_key))
+
+    figure_key = chart_key(dataset_key, Filters())
+    for view, builder, params in DEFAULT_CHARTS:
+        step(f"chart_{view}", lambda: cached_chart(cube, figure_key, builder, params))
+    return timings
+
+
+def start_background(log=print):
+    """Run ``warm_up`` on a daemon thread once the Streamlit runtime exists."""
+    def run():
+        # Caches created before the runtime would not use its cache storage
+        while not runtime.exists():
+            time.sleep(0.1)
+        start = time.perf_counter()
+        try:
+            warm_up(log)
+        except Exception as e:
+            log(f"Cache warm-up failed: {str(e)}")
+            return
+        log(f"Caches warmed in {time.perf_counter() - start:.1f}s")
+
+    thread = threading.Thread(target=run, name="sfcrime-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm the dashboard's caches.")
+    parser.add_argument('--serve', action='store_true',
+                        help="start the app and warm its caches in the background")
+    parser.add_argument('--app', default=APP_SCRIPT, help="app script to serve (default: %(default)s)")
+    parser.add_argument('streamlit_args', nargs='*', help="options for streamlit run, after --")
+    args = parser.parse_args(argv)
+
+    if not args.serve:
+        warm_up()
+        return 0
+
+    from streamlit.web import cli as streamlit_cli
+    start_background()
+    sys.argv = ['streamlit', 'run', args.app, *args.streamlit_args]
+    return streamlit_cli.main()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
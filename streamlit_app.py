@@ -1,11 +1,25 @@
+import io
+import os
+import time
+
 import streamlit as st
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime
-import plotly.express as px
-import plotly.graph_objects as go
+
+from sfcrime import charts
+from sfcrime.app_cache import (cached_chart, chart_key, load_cube, load_demo_data, load_filtered_cube,
+                               load_frame_backend, load_parquet_backend, load_store_data)
+from sfcrime.backend import PARQUET_DIR, CubeBackend, parquet_signature
+from sfcrime.charts import PALETTES
+from sfcrime.crosstab import CROSSTAB_DIMENSIONS
+from sfcrime.filters import Filters
+from sfcrime.data import DEMO_CSV, file_fingerprint, memory_report
+from sfcrime.ingest import ChunkedIngest, ingest_csv
+from sfcrime.model import DEFAULT_PARAMS, missing_features, model_path, model_size, prediction_summary, train_or_load
+from sfcrime.profiling import PROFILE_LOG, RunProfiler
+from sfcrime.spatial import MAX_ZOOM, MIN_ZOOM, parse_point
+from sfcrime.store import IncidentStore
+from sfcrime.timeseries import FREQUENCIES
+from sfcrime.upload_cache import UploadCache, content_hash
 
 # Set page config
 st.set_page_config(
@@ -43,74 +57,249 @@ st.markdown("""
 st.markdown('<p class="main-header">San Francisco Crime Data Visualization</p>', unsafe_allow_html=True)
 
 # Sidebar
-st.sidebar.title("Visualization Settings (Now just use demo data)")
+st.sidebar.title("Visualization Settings")
 
 # File uploader
-uploaded_file = st.sidebar.file_uploader("Upload your SF crime data CSV (Not supported yet)", type="csv")
+uploaded_file = st.sidebar.file_uploader("Upload your SF crime data CSV", type="csv")
 
-# Initialize date_column variable
-date_column = None
+# Batches appended to the store replace the demo data once it holds any rows
+try:
+    store = IncidentStore()
+except ValueError as e:
+    st.sidebar.warning(str(e))
+    store = None
 
-# Demo data loading function
-@st.cache_data
-def load_demo_data():
-    try:
-        data = pd.read_csv("train_small.csv")
-        df = pd.DataFrame(data)
-        df.drop_duplicates(inplace=True)
-        
-        # Handle date columns
-        if 'Dates' in df.columns:
-            df['Dates'] = pd.to_datetime(df['Dates'])
-            df['Hour'] = df['Dates'].dt.hour
-            df['Month'] = df['Dates'].dt.month
-            df['Year'] = df['Dates'].dt.year
-            df['Day'] = df['Dates'].dt.day
-            df['DayOfWeek'] = df['Dates'].dt.day_name()
-            df['MonthName'] = df['Dates'].dt.month_name()
-        
-        # Ensure required columns exist
-        required_columns = ['Category', 'PdDistrict', 'X', 'Y']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            st.error(f"Missing required columns in dataset: {', '.join(missing_columns)}")
-            return None
-            
-        return df
-    except Exception as e:
-        st.error(f"Error loading demo data: {str(e)}")
-        return None
+if uploaded_file is not None and store is not None:
+    if st.sidebar.button("Append to stored dataset", help="Add the rows of this file that are not stored yet"):
+        try:
+            added, read = store.append(io.BytesIO(uploaded_file.getvalue()))
+            st.sidebar.success(f"Added {added:,} of {read:,} rows; the rest were already stored.")
+        except (RuntimeError, ValueError) as e:
+            st.sidebar.error(f"Could not append the file: {str(e)}")
+
+# Opt-in profiling of each rerun (also enabled by SFCRIME_PROFILE=1)
+with st.sidebar.expander("Debug"):
+    profile_enabled = st.checkbox("Profile reruns", value=os.environ.get("SFCRIME_PROFILE") == "1",
+                                  help=f"Time every stage of this page and append the results to {PROFILE_LOG}")
+profiler = RunProfiler(enabled=profile_enabled)
+
+# Dashboard views; only the selected one is computed on each rerun. The chart
+# each view opens with is pre-rendered by sfcrime.warmup, whose DEFAULT_CHARTS
+# must follow the widget defaults below
+VIEWS = ["Crime Categories", "District Distribution", "Time Analysis", "Additional Insights", "Prediction"]
+
+# Render a chart, recording its build time and payload size when profiling
+def show_chart(fig, view):
+    profiler.chart(view, fig)
+    with profiler.stage(view, 'render'):
+        st.plotly_chart(fig, use_container_width=True)
+
+# Seconds of upload parsing per rerun before the partial results are shown
+INGEST_TIME_BUDGET = 1.0
+
+# Build a figure through the shared figure cache, then render it
+def render_chart(view, builder, source, *params):
+    with profiler.stage(view, 'build'):
+        fig = cached_chart(source, figure_key, builder, params)
+    show_chart(fig, view)
+
+# Parsed uploads keyed by content hash, shared by every session in this process
+@st.cache_resource
+def get_upload_cache():
+    return UploadCache()
+
+# Grid-binned map points, cached per dataset, filter selection and zoom level
+@st.cache_data(max_entries=32)
+def load_spatial_bins(_backend, dataset_key, filters, zoom):
+    return _backend.map_bins(zoom, filters)
+
+# Daily counts per group, cached per dataset and filter selection; date ranges
+# are answered from the series itself, so they are left out of the key
+@st.cache_data(max_entries=16)
+def load_daily_series(_backend, dataset_key, filters, group_by):
+    return _backend.daily_series(group_by, filters)
+
+# Sparse category and description crosstab, counted once per dataset and filter
+# selection; every heatmap and drill-down step is sliced from it. Shared read-only
+@st.cache_resource(max_entries=8)
+def load_crosstab(_backend, dataset_key, filters):
+    return _backend.crosstab(filters)
+
+# Column dimensions offered by the category and description heatmaps
+HEATMAP_COLUMNS = {
+    "District": ('PdDistrict',),
+    "Hour": ('Hour',),
+    "Day of Week": ('DayOfWeek',),
+    "Day of Week and Hour": ('DayOfWeek', 'Hour'),
+    "District and Hour": ('PdDistrict', 'Hour'),
+    "District and Day of Week": ('PdDistrict', 'DayOfWeek'),
+}
+
+# Radius searches, cached per dataset, filter selection, location and radius
+@st.cache_data(max_entries=64)
+def load_nearby(_backend, dataset_key, filters, location, radius):
+    return _backend.nearby(*location, radius, filters)
+
+# Category models, trained once per dataset and parameters and kept on disk;
+# a loaded model is shared by all sessions
+@st.cache_resource(max_entries=4)
+def load_model(_df, dataset_key, params):
+    return train_or_load(_df, dict(params), dataset_key)
+
+# Predictions for a scored frame, with the seconds they took
+@st.cache_resource(max_entries=4)
+def score_frame(_model, _df, model_key, frame_key):
+    start = time.perf_counter()
+    predictions = _model.predict(_df)
+    return predictions, time.perf_counter() - start
+
+# A CSV uploaded for scoring, parsed once per file
+@st.cache_resource(max_entries=2)
+def load_scoring_upload(_file, file_id):
+    scored, _ = ingest_csv(io.BytesIO(_file.getvalue()))
+    return scored
+
+# Predictions as CSV for the download button, built once per scored frame
+@st.cache_data(max_entries=2)
+def predictions_csv(_scored, _predictions, model_key, frame_key):
+    columns = [col for col in PREDICTION_COLUMNS if col in _scored.columns]
+    rows = slice(0, MAX_DOWNLOAD_ROWS)
+    return pd.concat([_scored[columns].iloc[rows], _predictions.iloc[rows]], axis=1).to_csv(index=False)
+
+# Input columns shown and downloaded next to the predictions
+PREDICTION_COLUMNS = ['Dates', 'Address', 'PdDistrict', 'Category']
+MAX_DOWNLOAD_ROWS = 1_000_000
 
 # Load data
+dataset_key = None
+backend = None
+cube = None
+ingest = None
+df = None
 if uploaded_file is not None:
     try:
-        df = pd.read_csv(uploaded_file)
-        # Ensure proper datetime conversion and hour extraction if needed
-        date_column = 'Date' if 'Date' in df.columns else 'Dates'
-        if date_column in df.columns:
-            df[date_column] = pd.to_datetime(df[date_column])
-            if 'Hour' not in df.columns:
-                df['Hour'] = df[date_column].dt.hour
-            if 'DayOfWeek' not in df.columns:
-                df['DayOfWeek'] = df[date_column].dt.day_name()
-            if 'Month' not in df.columns:
-                df['Month'] = df[date_column].dt.month_name()
+        # Hash the upload once per file; identical content from any session reuses the parsed data
+        hashed_id, content_key = st.session_state.get('upload_hash', (None, None))
+        if hashed_id != uploaded_file.file_id:
+            content_key = content_hash(uploaded_file)
+            st.session_state['upload_hash'] = (uploaded_file.file_id, content_key)
+        
+        upload_cache = get_upload_cache()
+        with profiler.stage('load', 'upload_cache'):
+            cached = upload_cache.get(content_key)
+        if cached is not None:
+            df, cube = cached
+            dataset_key = f"upload:{content_key}"
+        else:
+            # Parse the upload in chunks across reruns, so the cube-based charts can be
+            # explored on the rows read so far while the rest of the file streams in
+            ingest_key, ingest = st.session_state.get('upload_ingest', (None, None))
+            if ingest_key != content_key:
+                ingest = ChunkedIngest(uploaded_file, total_bytes=uploaded_file.size)
+                st.session_state['upload_ingest'] = (content_key, ingest)
+            if not ingest.done:
+                with profiler.stage('load', 'upload_ingest'):
+                    ingest.read(time_budget=INGEST_TIME_BUDGET)
+            
+            cube = ingest.cube
+            if ingest.done:
+                dataset_key = f"upload:{content_key}"
+                st.session_state.pop('upload_ingest', None)
+                # The rows are joined and indexed once, after the last chunk
+                df = ingest.frame()
+                if df is not None:
+                    # Continue with the memory-mapped copy so the parsed rows can be freed
+                    df, cube = upload_cache.put(content_key, df, cube)
+                else:
+                    st.error("The uploaded file contains no rows.")
+            else:
+                dataset_key = f"upload:{content_key}:{ingest.rows}"
+                st.sidebar.progress(ingest.progress, text=f"Loading upload: {ingest.rows:,} rows so far")
+                if cube is not None:
+                    backend = CubeBackend(cube, ingest.rows)
     except Exception as e:
         st.error(f"Error loading uploaded file: {str(e)}")
+        st.session_state.pop('upload_ingest', None)
         df = None
+        ingest = None
+elif PARQUET_DIR:
+    # Out-of-core history: only aggregates are pulled into memory
+    st.session_state.pop('upload_ingest', None)
+    try:
+        with profiler.stage('load', 'parquet'):
+            signature = parquet_signature(PARQUET_DIR)
+            backend = load_parquet_backend(PARQUET_DIR, signature)
+        dataset_key = f"parquet:{signature}"
+        with profiler.stage('load', 'cube', rows=backend.rows):
+            cube = load_filtered_cube(backend, dataset_key, Filters())
+        st.sidebar.info(f"Querying {backend.rows:,} incidents from {PARQUET_DIR}.")
+    except Exception as e:
+        st.error(f"Error opening the Parquet dataset: {str(e)}")
+        backend = None
+elif store is not None and store.rows:
+    st.session_state.pop('upload_ingest', None)
+    with profiler.stage('load', 'store', rows=store.rows):
+        df, cube = load_store_data(store.root, store.key)
+    dataset_key = f"store:{store.key}"
+    st.sidebar.info(f"Using the stored dataset: {store.rows:,} incidents from {store.batches} appended batches.")
 else:
-    df = load_demo_data()
+    st.session_state.pop('upload_ingest', None)
+    with profiler.stage('load', 'demo_data'):
+        df = load_demo_data()
     if df is not None:
-        date_column = 'Dates'  # Set date_column for demo data
+        dataset_key = f"demo:{file_fingerprint(DEMO_CSV)}"
+        with profiler.stage('load', 'cube', rows=len(df)):
+            cube = load_cube(df, dataset_key)
         st.sidebar.info("Using demo data. Upload your own CSV for custom analysis.")
     else:
         st.error("Failed to load demo data. Please check the data file.")
 
 if df is not None:
-    # Create tabs for different visualizations
-    tab1, tab2, tab3, tab4 = st.tabs(["Crime Categories", "District Distribution", "Time Analysis", "Additional Insights"])
+    # Memory footprint of the loaded frame
+    with st.sidebar.expander("Memory usage"):
+        mem_df = memory_report(df)
+        st.write(f"Total: {mem_df['Bytes'].sum() / 1024 ** 2:.1f} MB for {len(df):,} rows")
+        st.dataframe(mem_df, hide_index=True)
+    
+    # Loaded rows are filtered through the bitmap index
+    with profiler.stage('load', 'bitmap_index', rows=len(df)):
+        backend = load_frame_backend(df, cube, dataset_key)
 
-    with tab1:
+# While an upload streams in only its cube exists; the views that need rows wait for the last chunk
+uploading = ingest is not None and not ingest.done
+ROWS_PENDING = "This view is available once the upload has finished loading."
+
+if backend is not None:
+    # Global filters, applied to every view
+    date_bounds = backend.date_bounds()
+    with st.sidebar.expander("Filters", expanded=True):
+        date_range = ()
+        if date_bounds is not None:
+            date_range = st.date_input("Date range", value=date_bounds,
+                                       min_value=date_bounds[0], max_value=date_bounds[1])
+        districts = st.multiselect("Districts", backend.values('PdDistrict'), placeholder="All districts")
+        categories = st.multiselect("Categories", backend.values('Category'), placeholder="All categories")
+        resolutions = st.multiselect("Resolution", backend.values('Resolution'), placeholder="All resolutions")
+        hours = (0, 23)
+        if backend.values('Hour'):
+            hours = st.slider("Hour window", 0, 23, hours)
+    
+    # Bounds left at the edges of the data do not filter anything
+    start = date_range[0] if len(date_range) > 0 and date_range[0] > date_bounds[0] else None
+    end = date_range[1] if len(date_range) > 1 and date_range[1] < date_bounds[1] else None
+    filters = Filters(start, end, tuple(districts), tuple(categories), tuple(resolutions), tuple(hours))
+    figure_key = chart_key(dataset_key, filters)
+    
+    if filters.active:
+        total_incidents = cube['Count'].sum()
+        with profiler.stage('load', 'filter', rows=backend.rows):
+            cube = load_filtered_cube(backend, dataset_key, filters)
+        st.sidebar.caption(f"Showing {cube['Count'].sum():,} of {total_incidents:,} incidents")
+    
+    # Only the selected view runs, so a widget change recomputes one chart instead of all four
+    active_view = st.radio("View", VIEWS, horizontal=True, key="active_view", label_visibility="collapsed")
+
+    if active_view == "Crime Categories":
         st.markdown('<p class="subheader">Crime Distribution by Category</p>', unsafe_allow_html=True)
         
         # Controls for category visualization
@@ -118,109 +307,31 @@ if df is not None:
         with col1:
             num_categories = st.slider("Number of top categories to show", 5, 20, 15)
         with col2:
-            color_palette = st.selectbox("Color palette", 
-                                       ["Plotly", "D3", "G10", "T10", "Alphabet", "Dark24", "Light24",
-                                        "Set1", "Set2", "Set3", "Pastel1", "Pastel2", "Paired"])
+            color_palette = st.selectbox("Color palette", PALETTES)
         
         # Visualization options
         chart_type = st.radio("Chart type", ["Bar Chart", "Horizontal Bar", "Treemap"], horizontal=True)
         
-        # Get top crimes
-        top_crimes = df['Category'].value_counts().head(num_categories)
-        top_crimes_df = pd.DataFrame({'Category': top_crimes.index, 'Count': top_crimes.values})
-        
-        if chart_type == "Bar Chart":
-            fig = px.bar(
-                top_crimes_df, 
-                x='Category', 
-                y='Count',
-                color='Category',
-                color_discrete_sequence=px.colors.qualitative.__dict__.get(color_palette, px.colors.qualitative.Plotly),
-                labels={'Count': 'Number of Incidents', 'Category': 'Crime Category'},
-                title=f'Top {num_categories} Crime Categories'
-            )
-            fig.update_layout(xaxis_tickangle=-45)
-            st.plotly_chart(fig, use_container_width=True)
-            
-        elif chart_type == "Horizontal Bar":
-            fig = px.bar(
-                top_crimes_df, 
-                x='Count', 
-                y='Category',
-                color='Category',
-                color_discrete_sequence=px.colors.qualitative.__dict__.get(color_palette, px.colors.qualitative.Plotly),
-                labels={'Count': 'Number of Incidents', 'Category': 'Crime Category'},
-                title=f'Top {num_categories} Crime Categories',
-                orientation='h'
-            )
-            st.plotly_chart(fig, use_container_width=True)
-            
-        else:  # Treemap
-            fig = px.treemap(
-                top_crimes_df, 
-                path=['Category'], 
-                values='Count',
-                color='Count',
-                color_continuous_scale=px.colors.qualitative.__dict__.get(color_palette, px.colors.qualitative.Plotly),
-                title=f'Top {num_categories} Crime Categories'
-            )
-            st.plotly_chart(fig, use_container_width=True)
+        render_chart('categories', 'category_chart', cube, num_categories, chart_type, color_palette)
 
-    with tab2:
+    elif active_view == "District Distribution":
         st.markdown('<p class="subheader">Crime Distribution by District</p>', unsafe_allow_html=True)
         
         # Controls for district visualization
         viz_type = st.radio("Visualization type", ["Pie Chart", "Bar Chart", "Map"], horizontal=True)
         
         if viz_type in ["Pie Chart", "Bar Chart"]:
-            # Get district counts
-            district_counts = df['PdDistrict'].value_counts()
-            district_df = pd.DataFrame({'District': district_counts.index, 'Count': district_counts.values})
-            
             # Color options
-            district_color = st.selectbox("Color scheme for districts", 
-                                        ["Plotly", "D3", "G10", "T10", "Alphabet", "Dark24", "Light24",
-                                         "Set1", "Set2", "Set3", "Pastel1", "Pastel2", "Paired"])
+            district_color = st.selectbox("Color scheme for districts", PALETTES)
             
             if viz_type == "Pie Chart":
                 # Control for pie chart
                 donut = st.checkbox("Display as donut chart", value=False)
-                
-                fig = px.pie(
-                    district_df,
-                    names='District',
-                    values='Count',
-                    title='Crime Distribution by District',
-                    color_discrete_sequence=px.colors.qualitative.__dict__.get(district_color, px.colors.qualitative.Plotly)
-                )
-                
-                if donut:
-                    fig.update_traces(hole=0.4)
-                    
-                fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5))
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart('districts', 'district_chart', cube, viz_type, district_color, donut)
                 
             else:  # Bar Chart
                 sort_order = st.radio("Sort order", ["Descending", "Ascending", "Alphabetical"], horizontal=True)
-                
-                if sort_order == "Descending":
-                    district_df = district_df.sort_values('Count', ascending=False)
-                elif sort_order == "Ascending":
-                    district_df = district_df.sort_values('Count', ascending=True)
-                else:  # Alphabetical
-                    district_df = district_df.sort_values('District')
-                    
-                fig = px.bar(
-                    district_df,
-                    x='District',
-                    y='Count',
-                    color='District',
-                    title='Crime by District',
-                    color_discrete_sequence=px.colors.qualitative.__dict__.get(district_color, px.colors.qualitative.Plotly)
-                )
-                
-                fig.update_layout(xaxis_tickangle=-45)
-                st.plotly_chart(fig, use_container_width=True)
+                render_chart('districts', 'district_chart', cube, viz_type, district_color, False, sort_order)
         
         else:  # Map
             # Map visualization options
@@ -228,228 +339,159 @@ if df is not None:
                 "Map Style",
                 ["open-street-map", "carto-positron", "carto-darkmatter"]
             )
+            map_zoom = st.slider("Map detail (zoom level)", MIN_ZOOM, MAX_ZOOM, 11,
+                                 help="Higher levels use smaller grid cells and start the map zoomed in further")
             
             # Validate coordinates
-            if 'X' not in df.columns or 'Y' not in df.columns:
+            if uploading:
+                st.info(ROWS_PENDING)
+            elif 'X' not in backend.columns or 'Y' not in backend.columns:
                 st.error("X and Y coordinates are required for map visualization. Please ensure your data contains these columns.")
             else:
-                # Calculate counts for each location
-                location_counts = df.groupby(['X', 'Y', 'Category']).size().reset_index(name='Count')
+                # Bin locations into grid cells sized for the zoom level,
+                # colored by each cell's most frequent category
+                with profiler.stage('districts', 'aggregate', rows=backend.rows):
+                    location_counts = load_spatial_bins(backend, dataset_key, filters, map_zoom)
+                
+                render_chart('districts', 'district_map', location_counts, map_style, map_zoom)
                 
-                # Create the map
-                fig = px.scatter_mapbox(
-                    location_counts,
-                    lat="Y",  # Y coordinate as latitude
-                    lon="X",  # X coordinate as longitude
-                    color="Category",
-                    size="Count",
-                    hover_name="Category",
-                    hover_data=["Count"],
-                    zoom=11,
-                    height=600,
-                    title="Crime Hotspots in San Francisco"
-                )
+                # Incidents around an address or a "lat, lon" point
+                st.markdown("#### Incidents around a location")
+                col1, col2 = st.columns([2, 1])
+                with col1:
+                    place = st.text_input("Address or point", placeholder="e.g. 800 Block of BRYANT ST or 37.7749, -122.4194")
+                with col2:
+                    radius = st.slider("Radius (meters)", 50, 2000, 250, step=50)
                 
-                fig.update_layout(
-                    mapbox_style=map_style,
-                    mapbox_center={"lat": 37.7749, "lon": -122.4194},  # San Francisco coordinates
-                    margin={"r":0,"t":30,"l":0,"b":0}
-                )
+                location = parse_point(place) if place else None
+                if place and location is None:
+                    matches = backend.search_addresses(place)
+                    if matches:
+                        address = st.selectbox("Matching addresses", matches)
+                        location = backend.locate(address)
+                    else:
+                        st.info("No matching address or point in San Francisco.")
                 
-                st.plotly_chart(fig, use_container_width=True)
+                if location is not None:
+                    with profiler.stage('districts', 'radius_search', rows=backend.rows):
+                        nearby = load_nearby(backend, dataset_key, filters, location, radius)
+                    st.write(f"{nearby.total:,} incidents within {radius} m")
+                    if nearby.total:
+                        render_chart('districts', 'nearby_map', nearby, location, radius, map_style)
+                        col1, col2 = st.columns([1, 2])
+                        with col1:
+                            st.write("Top categories")
+                            st.dataframe(nearby.categories.head(10), hide_index=True)
+                        with col2:
+                            st.write("Closest incidents")
+                            st.dataframe(nearby.incidents.head(100), hide_index=True)
 
-    with tab3:
+    elif active_view == "Time Analysis":
         st.markdown('<p class="subheader">Crime Analysis by Time</p>', unsafe_allow_html=True)
         
         # Time analysis type
-        time_analysis = st.radio("Analyze by", ["Hour of Day", "Day of Week", "Month"], horizontal=True)
+        time_analysis = st.radio("Analyze by", ["Hour of Day", "Day of Week", "Month", "Trend over time"],
+                                 horizontal=True)
         
-        # Line style options
+        if time_analysis == "Trend over time":
+            # Resampling and smoothing of the daily series
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                granularity = st.radio("Granularity", list(FREQUENCIES), horizontal=True)
+            with col2:
+                rolling_window = st.slider("Rolling average (periods)", 1, 30, 1)
+            split_by = st.selectbox("Split by", ["None", "Category", "District"])
+            top_n_series = None
+            if split_by != "None":
+                top_n_series = st.slider("Number of series", 1, 10, 5)
+        
+        # Line style options; trends are drawn without markers
+        show_markers = time_analysis != "Trend over time"
         col1, col2 = st.columns([1, 1])
         with col1:
             line_color = st.color_picker("Line color", "#483D8B")
         with col2:
-            marker_color = st.color_picker("Marker color", "#9370DB")
+            marker_color = st.color_picker("Marker color", "#9370DB") if show_markers else None
         
-        marker_size = st.slider("Marker size", 5, 15, 8)
+        marker_size = st.slider("Marker size", 5, 15, 8) if show_markers else None
         line_width = st.slider("Line width", 1, 5, 2)
         
-        if time_analysis == "Hour of Day":
-            if 'Hour' in df.columns:
-                # Group by hour
-                crime_by_hour = df.groupby('Hour')['Category'].count().reset_index()
-                crime_by_hour.columns = ['Hour', 'Count']
-                
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(
-                    x=crime_by_hour['Hour'],
-                    y=crime_by_hour['Count'],
-                    mode='lines+markers',
-                    line=dict(color=line_color, width=line_width),
-                    marker=dict(color=marker_color, size=marker_size),
-                    name='Incidents'
-                ))
-                
-                fig.update_layout(
-                    title='Crime Incidents by Hour of Day',
-                    xaxis=dict(
-                        title='Hour (24-hour format)',
-                        tickmode='linear',
-                        tick0=0,
-                        dtick=1
-                    ),
-                    yaxis=dict(title='Number of Incidents'),
-                    hovermode='x',
-                    plot_bgcolor='rgba(240, 240, 240, 0.5)'
-                )
-                
-                st.plotly_chart(fig, use_container_width=True)
+        if time_analysis == "Trend over time":
+            if uploading:
+                st.info(ROWS_PENDING)
+            elif 'Dates' not in backend.columns:
+                st.warning("Trend analysis requires a Date column in your dataset.")
             else:
-                st.error("Hour data is not available in the dataset.")
-        
-        elif time_analysis == "Day of Week":
-            # Ensure proper day of week ordering
-            day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            
-            # Group by day of week
-            crime_by_dow = df['DayOfWeek'].value_counts().reset_index()
-            crime_by_dow.columns = ['DayOfWeek', 'Count']
-            
-            # Reorder days
-            crime_by_dow['DayOfWeek'] = pd.Categorical(crime_by_dow['DayOfWeek'], categories=day_order, ordered=True)
-            crime_by_dow = crime_by_dow.sort_values('DayOfWeek')
-            
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(
-                x=crime_by_dow['DayOfWeek'],
-                y=crime_by_dow['Count'],
-                mode='lines+markers',
-                line=dict(color=line_color, width=line_width),
-                marker=dict(color=marker_color, size=marker_size),
-                name='Incidents'
-            ))
-            
-            fig.update_layout(
-                title='Crime Incidents by Day of Week',
-                xaxis=dict(title='Day of Week'),
-                yaxis=dict(title='Number of Incidents'),
-                hovermode='x',
-                plot_bgcolor='rgba(240, 240, 240, 0.5)'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-        
-        else:  # Month analysis
-            if date_column in df.columns:
-                # Extract month
-                df['Month'] = df[date_column].dt.month_name()
-                
-                # Ensure proper month ordering
-                month_order = ['January', 'February', 'March', 'April', 'May', 'June', 
-                              'July', 'August', 'September', 'October', 'November', 'December']
-                
-                # Group by month
-                crime_by_month = df['Month'].value_counts().reset_index()
-                crime_by_month.columns = ['Month', 'Count']
-                
-                # Reorder months
-                crime_by_month['Month'] = pd.Categorical(crime_by_month['Month'], categories=month_order, ordered=True)
-                crime_by_month = crime_by_month.sort_values('Month')
-                
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(
-                    x=crime_by_month['Month'],
-                    y=crime_by_month['Count'],
-                    mode='lines+markers',
-                    line=dict(color=line_color, width=line_width),
-                    marker=dict(color=marker_color, size=marker_size),
-                    name='Incidents'
-                ))
-                
-                fig.update_layout(
-                    title='Crime Incidents by Month',
-                    xaxis=dict(title='Month'),
-                    yaxis=dict(title='Number of Incidents'),
-                    hovermode='x',
-                    plot_bgcolor='rgba(240, 240, 240, 0.5)'
-                )
-                
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("Month analysis requires a Date column in your dataset.")
+                group_by = {"None": None, "Category": "Category", "District": "PdDistrict"}[split_by]
+                with profiler.stage('time', 'aggregate', rows=backend.rows):
+                    series = load_daily_series(backend, dataset_key, filters._replace(start=None, end=None), group_by)
+                render_chart('time', 'trend_chart', series, group_by, granularity, rolling_window,
+                             filters.start, filters.end, top_n_series, line_color, line_width)
+        elif time_analysis == "Hour of Day" and 'Hour' not in cube.columns:
+            st.error("Hour data is not available in the dataset.")
+        elif time_analysis == "Day of Week" and 'DayOfWeek' not in cube.columns:
+            st.error("Day of week data is not available in the dataset.")
+        elif time_analysis == "Month" and 'Month' not in cube.columns:
+            st.warning("Month analysis requires a Date column in your dataset.")
+        else:
+            render_chart('time', 'time_chart', cube, time_analysis, line_color, marker_color, marker_size, line_width)
 
-    with tab4:
+    elif active_view == "Additional Insights":
         st.markdown('<p class="subheader">Additional Insights</p>', unsafe_allow_html=True)
         
         insight_type = st.selectbox(
             "Select insight type",
-            ["Crime Category by District", "Crime Category by Time of Day", "Custom Analysis"]
+            ["Crime Category by District", "Crime Category by Time of Day",
+             "Category and Description Heatmaps", "Custom Analysis"]
         )
 
         if insight_type == "Crime Category by District":
             # Get top categories for analysis
             top_n_categories = st.slider("Number of categories to analyze", 3, 10, 5)
-            top_categories = df['Category'].value_counts().head(top_n_categories).index.tolist()
-            
-            # Filter data
-            filtered_df = df[df['Category'].isin(top_categories)]
-            
-            # Create pivot table
-            pivot_df = pd.crosstab(filtered_df['Category'], filtered_df['PdDistrict'])
             
             # Visualization
             st.write(f"Distribution of Top {top_n_categories} Crime Categories Across Districts")
             
             # Choose between heatmap and stacked bar
             viz_option = st.radio("Visualization type", ["Heatmap", "Stacked Bar Chart"], horizontal=True)
-            
-            if viz_option == "Heatmap":
-                fig = px.imshow(
-                    pivot_df,
-                    color_continuous_scale='RdBu_r',
-                    aspect="auto",
-                    labels=dict(x="District", y="Crime Category", color="Count")
-                )
-                fig.update_layout(height=500)
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                fig = px.bar(
-                    pivot_df.reset_index().melt(id_vars='Category', var_name='District', value_name='Count'),
-                    x='District',
-                    y='Count',
-                    color='Category',
-                    barmode='stack',
-                    labels={'Count': 'Number of Incidents'}
-                )
-                fig.update_layout(xaxis_tickangle=-45)
-                st.plotly_chart(fig, use_container_width=True)
+            render_chart('insights', 'category_district_chart', cube, top_n_categories, viz_option)
 
         elif insight_type == "Crime Category by Time of Day":
             # Get top categories for analysis
             top_n_categories = st.slider("Number of categories to analyze", 3, 10, 5)
-            top_categories = df['Category'].value_counts().head(top_n_categories).index.tolist()
-            
-            # Filter data
-            filtered_df = df[df['Category'].isin(top_categories)]
-            
-            # Group by category and hour
-            hour_cat_df = filtered_df.groupby(['Category', 'Hour']).size().reset_index(name='Count')
-            
-            fig = px.line(
-                hour_cat_df,
-                x='Hour',
-                y='Count',
-                color='Category',
-                labels={'Count': 'Number of Incidents', 'Hour': 'Hour of Day'},
-                title=f'Crime Patterns Throughout the Day for Top {top_n_categories} Categories'
-            )
-            
-            fig.update_layout(
-                xaxis=dict(tickmode='linear', tick0=0, dtick=1),
-                legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5)
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart('insights', 'category_hour_chart', cube, top_n_categories)
+
+        elif insight_type == "Category and Description Heatmaps":
+            missing_columns = [dim for dim in CROSSTAB_DIMENSIONS if dim not in backend.columns]
+            if uploading:
+                st.info(ROWS_PENDING)
+            elif missing_columns:
+                st.warning(f"These heatmaps require the columns: {', '.join(missing_columns)}")
+            else:
+                with profiler.stage('insights', 'aggregate', rows=backend.rows):
+                    crosstab = load_crosstab(backend, dataset_key, filters)
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    heatmap_columns = st.selectbox("Columns", list(HEATMAP_COLUMNS), index=3)
+                with col2:
+                    heatmap_rows = st.radio("Rows", ["Categories", "Descriptions"], horizontal=True)
+                
+                # Drill down from the categories to the descriptions of one of them
+                drill_category = None
+                top_n_rows = None
+                if heatmap_rows == "Descriptions":
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        drill = st.selectbox("Category", ["All categories"] + crosstab.categories())
+                        drill_category = None if drill == "All categories" else drill
+                    with col2:
+                        top_n_rows = st.slider("Number of descriptions", 10, 200, 50)
+                normalize = st.checkbox("Show each row as shares of its total")
+                
+                render_chart('insights', 'crosstab_chart', crosstab, HEATMAP_COLUMNS[heatmap_columns],
+                             'Descript' if heatmap_rows == "Descriptions" else 'Category',
+                             drill_category, top_n_rows, normalize)
 
         else:  # Custom Analysis
             st.write("Build your own custom analysis by selecting dimensions to compare:")
@@ -467,59 +509,100 @@ if df is not None:
             
             # Generate analysis
             if x_axis != color_by or color_by == 'None':
-                if color_by == 'None':
-                    # Simple count by x_axis
-                    if y_axis == 'Count':
-                        count_df = df[x_axis].value_counts().reset_index()
-                        count_df.columns = [x_axis, 'Count']
-                        
-                        fig = px.bar(
-                            count_df,
-                            x=x_axis,
-                            y='Count',
-                            title=f'Crime Incidents by {x_axis}'
-                        )
-                    else:  # Percentage
-                        count_df = df[x_axis].value_counts(normalize=True).reset_index()
-                        count_df.columns = [x_axis, 'Percentage']
-                        count_df['Percentage'] = count_df['Percentage'] * 100
-                        
-                        fig = px.bar(
-                            count_df,
-                            x=x_axis,
-                            y='Percentage',
-                            title=f'Crime Incidents by {x_axis} (%)'
-                        )
-                else:
-                    # Count by x_axis and color_by
-                    if y_axis == 'Count':
-                        count_df = df.groupby([x_axis, color_by]).size().reset_index(name='Count')
+                render_chart('insights', 'custom_chart', cube, x_axis, y_axis,
+                             None if color_by == 'None' else color_by)
+            else:
+                st.warning("Please select different dimensions for X-axis and Color")
+
+    else:  # Prediction
+        st.markdown('<p class="subheader">Crime Category Prediction</p>', unsafe_allow_html=True)
+        
+        if uploading:
+            st.info("The model can be trained once the upload has finished loading.")
+        elif df is None:
+            st.info("The prediction model trains on incidents held in memory, so it is not available for the Parquet dataset.")
+        elif missing_features(df):
+            st.warning(f"Prediction requires the columns: {', '.join(missing_features(df))}")
+        else:
+            st.write("A gradient-boosted classifier predicts the category of an incident from its hour, "
+                     "weekday, month, district and location, trained on all loaded incidents.")
+            
+            # Hyperparameters; each combination is trained once and cached on disk
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                top_categories = st.slider("Categories predicted", 2, 39, DEFAULT_PARAMS['top_categories'],
+                                           help="Less frequent categories are predicted as OTHER")
+                grid_meters = st.select_slider("Location grid (meters)", [250, 500, 1000, 2000],
+                                               DEFAULT_PARAMS['grid_meters'])
+            with col2:
+                iterations = st.slider("Boosting iterations", 10, 200, DEFAULT_PARAMS['iterations'], step=10)
+                learning_rate = st.select_slider("Learning rate", [0.05, 0.1, 0.2, 0.3], DEFAULT_PARAMS['learning_rate'])
+            with col3:
+                max_leaf_nodes = st.select_slider("Leaves per tree", [15, 31, 63, 127], DEFAULT_PARAMS['max_leaf_nodes'])
+                sample_rows = st.select_slider("Training sample (rows)", [50_000, 100_000, 200_000, 500_000, 1_000_000],
+                                               DEFAULT_PARAMS['sample_rows'])
+            params = dict(top_categories=top_categories, grid_meters=grid_meters, iterations=iterations,
+                          learning_rate=learning_rate, max_leaf_nodes=max_leaf_nodes, sample_rows=sample_rows)
+            model_key = model_path(dataset_key, params)
+            
+            if os.path.exists(model_key) or st.button("Train model"):
+                model = None
+                try:
+                    with st.spinner("Training the model..."), profiler.stage('prediction', 'train', rows=len(df)):
+                        model = load_model(df, dataset_key, tuple(sorted(params.items())))
+                except Exception as e:
+                    st.error(f"Error training the model: {str(e)}")
+                
+                if model is not None:
+                    metrics = model.metrics
+                    col1, col2, col3, col4, col5 = st.columns(5)
+                    col1.metric("Holdout accuracy", f"{metrics['accuracy']:.1%}",
+                                f"{metrics['accuracy'] - metrics['baseline_accuracy']:+.1%} vs. most frequent class")
+                    col2.metric("Top-3 accuracy", f"{metrics['top3_accuracy']:.1%}")
+                    col3.metric("Log loss", f"{metrics['log_loss']:.3f}")
+                    col4.metric("Training time", f"{metrics['train_seconds']:.1f}s",
+                                help=f"{metrics['train_rows']:,} training and {metrics['holdout_rows']:,} holdout rows")
+                    col5.metric("Model size", f"{model_size(dataset_key, params) / 1024 ** 2:.1f} MB")
+                    
+                    # Score the loaded incidents or a separate file
+                    score_source = st.radio("Score", ["Loaded incidents", "Another CSV"], horizontal=True)
+                    scored, frame_key = df, dataset_key
+                    if score_source == "Another CSV":
+                        scored = None
+                        score_file = st.file_uploader("CSV to score", type="csv", key="score_file")
+                        if score_file is not None:
+                            try:
+                                scored, frame_key = load_scoring_upload(score_file, score_file.file_id), score_file.file_id
+                            except Exception as e:
+                                st.error(f"Error loading the file to score: {str(e)}")
+                            if scored is not None and missing_features(scored):
+                                st.warning(f"Scoring requires the columns: {', '.join(missing_features(scored))}")
+                                scored = None
+                    
+                    if scored is not None:
+                        with profiler.stage('prediction', 'score', rows=len(scored)):
+                            predictions, seconds = score_frame(model, scored, model_key, frame_key)
+                        st.write(f"Scored {len(scored):,} incidents in {seconds:.2f}s "
+                                 f"({len(scored) / max(seconds, 1e-9):,.0f} rows/s).")
                         
-                        fig = px.bar(
-                            count_df,
-                            x=x_axis,
-                            y='Count',
-                            color=color_by,
-                            title=f'Crime Incidents by {x_axis} and {color_by}'
-                        )
-                    else:  # Percentage
-                        # Calculate percentage within each x_axis group
-                        count_df = df.groupby([x_axis, color_by]).size().reset_index(name='Count')
-                        total_by_x = count_df.groupby(x_axis)['Count'].transform('sum')
-                        count_df['Percentage'] = count_df['Count'] / total_by_x * 100
+                        if 'Category' in scored.columns:
+                            accuracy, counts = prediction_summary(model, predictions, scored['Category'])
+                            st.write(f"Accuracy on these incidents: {accuracy:.1%}")
+                            with profiler.stage('prediction', 'build'):
+                                fig = charts.prediction_chart(counts)
+                            show_chart(fig, 'prediction')
                         
-                        fig = px.bar(
-                            count_df,
-                            x=x_axis,
-                            y='Percentage',
-                            color=color_by,
-                            title=f'Crime Incidents by {x_axis} and {color_by} (%)'
+                        columns = [col for col in PREDICTION_COLUMNS if col in scored.columns]
+                        st.dataframe(pd.concat([scored[columns].head(1000), predictions.head(1000)], axis=1), hide_index=True)
+                        st.download_button(
+                            "Download predictions",
+                            predictions_csv(scored, predictions, model_key, frame_key),
+                            file_name="predictions.csv",
+                            mime="text/csv",
+                            help=f"The first {MAX_DOWNLOAD_ROWS:,} rows with their predicted category and its probability"
                         )
-                
-                fig.update_layout(xaxis_tickangle=-45)
-                st.plotly_chart(fig, use_container_width=True)
             else:
-                st.warning("Please select different dimensions for X-axis and Color")
+                st.info("No model has been trained on this data with these settings yet.")
 
 # Footer Section
 st.markdown("---")
@@ -539,3 +622,13 @@ st.markdown("""
 You can easily export any chart by hovering over the visualization and clicking the **camera icon** to download it.
 """)
 
+# Profiling results for this rerun
+if profiler.enabled:
+    profiler.export(dataset=dataset_key, rows=None if backend is None else backend.rows)
+    with st.sidebar.expander("Profiling", expanded=True):
+        st.write(f"Rerun took {profiler.total_seconds():.3f}s")
+        st.dataframe(profiler.summary(), hide_index=True)
+
+# Keep streaming the upload; each rerun ingests another slice and redraws the charts
+if uploading:
+    st.rerun()
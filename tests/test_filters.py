@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sfcrime.filters import BitmapIndex, Filters
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    districts = np.array([f'D{i}' for i in range(10)], dtype=object)[rng.integers(0, 10, 5_000)]
+    # A few rows have no district
+    districts[rng.random(5_000) < 0.05] = None
+    return pd.DataFrame({'PdDistrict': pd.Categorical(districts)})
+
+
+@pytest.mark.parametrize('chosen', [2, 7, 10])
+def test_select_leaves_out_missing_values(frame, chosen):
+    index = BitmapIndex(frame, columns=['PdDistrict'])
+    districts = tuple(index.values('PdDistrict')[:chosen])
+    mask = index.mask(Filters(districts=districts))
+    np.testing.assert_array_equal(mask, frame['PdDistrict'].isin(districts).to_numpy())
@@ -0,0 +1,13 @@
+import numpy as np
+
+from sfcrime.model import HOLDOUT, stratified_holdout
+
+
+def test_stratified_holdout_trains_on_every_label():
+    labels = np.repeat(np.arange(5), [1000, 6, 3, 2, 1])
+    rng = np.random.default_rng(0)
+    labels = labels[rng.permutation(len(labels))]
+    for seed in range(10):
+        holdout = stratified_holdout(labels, HOLDOUT, np.random.default_rng(seed))
+        assert set(labels[~holdout]) == set(labels)
+        assert abs(holdout[labels == 0].mean() - HOLDOUT) < 0.01
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sfcrime.parallel import (MIN_PARTITION_ROWS, PARTITION_ROWS, count_combinations, default_partition_rows,
+                              partition_bounds)
+
+ROWS = 20_000
+
+
+def random_codes(shape, rows=ROWS, seed=0):
+    rng = np.random.default_rng(seed)
+    # Include -1 (a missing value) in every dimension
+    return [rng.integers(-1, n, rows) for n in shape]
+
+
+def expected_counts(codes, shape, mask=None, weights=None):
+    """The same counts from ``np.unique`` without weights, else from ``groupby``."""
+    keep = np.logical_and.reduce([c >= 0 for c in codes])
+    if mask is not None:
+        keep &= mask
+    flat = np.ravel_multi_index([c[keep] for c in codes], shape)
+    if weights is None:
+        return np.unique(flat, return_counts=True)
+    sums = pd.Series(weights[keep]).groupby(flat).sum()
+    sums = sums[sums > 0]
+    return sums.index.to_numpy(), sums.to_numpy()
+
+
+# (4, 6) is small enough for dense bincount tables, (300, 200, 50) is not
+SHAPES = {'dense': (4, 6), 'unique': (300, 200, 50)}
+
+
+@pytest.mark.parametrize('mode', SHAPES)
+@pytest.mark.parametrize('use_mask', [False, True])
+@pytest.mark.parametrize('use_weights', [False, True])
+@pytest.mark.parametrize('workers, partition_rows', [(1, None), (1, 3_000), (4, 3_000), (3, 7_001)])
+def test_count_combinations_matches_reference(mode, use_mask, use_weights, workers, partition_rows):
+    shape = SHAPES[mode]
+    codes = random_codes(shape)
+    rng = np.random.default_rng(1)
+    mask = rng.random(ROWS) < 0.7 if use_mask else None
+    weights = rng.integers(0, 5, ROWS) if use_weights else None
+
+    cells, counts = count_combinations(codes, shape, mask=mask, weights=weights,
+                                       workers=workers, partition_rows=partition_rows)
+    want_cells, want_counts = expected_counts(codes, shape, mask, weights)
+
+    np.testing.assert_array_equal(cells, want_cells)
+    np.testing.assert_array_equal(counts, want_counts)
+    assert counts.dtype == np.int64
+
+
+def test_count_combinations_empty_input():
+    codes = [np.array([], dtype=np.int64), np.array([], dtype=np.int64)]
+    cells, counts = count_combinations(codes, (3, 4), workers=4)
+    assert len(cells) == 0 and len(counts) == 0
+
+
+def test_default_partitions_spread_inputs_across_workers():
+    # A cube-sized input is split so every worker has a partition
+    rows = 8 * MIN_PARTITION_ROWS
+    assert len(partition_bounds(rows, default_partition_rows(rows, 4))) == 4
+    # Small inputs stay on one thread, large ones are capped at PARTITION_ROWS
+    assert len(partition_bounds(MIN_PARTITION_ROWS, default_partition_rows(MIN_PARTITION_ROWS, 4))) == 1
+    assert default_partition_rows(100 * PARTITION_ROWS, 4) == PARTITION_ROWS
+
+
+def test_partition_bounds_cover_every_row():
+    bounds = partition_bounds(10, 3)
+    assert bounds == [(0, 3), (3, 6), (6, 9), (9, 10)]